@@ -1,97 +1,391 @@
+"""
+Caption a local photo collection with BLIP.
+
+Usage:
+    python CaptionLocalImages.py IMAGE_DIR [--output localcaptions.jsonl]
+        [--batch-size 16] [--workers N] [--hash] [--retry-errors]
+        [--backend torch|onnx|onnx-int8] [--index caption_index]
+
+Captions are written as JSON lines ({"path", "size", "mtime", "caption"}, or
+"error" for files that could not be captioned). The output file is also the
+manifest of the next run: only images that are new or whose size or
+modification time changed are captioned again, and an interrupted run
+resumes where it stopped because every batch is appended as soon as it is
+done.
+
+With --index the searchable caption index of caption_index.py is updated
+after captioning.
+"""
+import argparse
+import hashlib
+import json
 import os
-import glob
-from typing import List
-from PIL import Image
-from transformers import BlipProcessor, BlipForConditionalGeneration
+from typing import Dict, List, Optional, Tuple
+import torch
+from torch.utils.data import DataLoader, Dataset
+from transformers import BlipImageProcessor, BlipProcessor, BlipForConditionalGeneration
+from onnx_backend import BACKENDS, load_blip
+from image_loader import BLIP_INPUT_SIZE, load_image
+
+
+# Images captioned per generate() call, and the number of worker processes
+# decoding and preprocessing the next batches while the model runs.
+BATCH_SIZE = 16
+NUM_WORKERS = max(1, (os.cpu_count() or 2) - 1)
 
 
-def load_model() -> tuple[BlipProcessor, BlipForConditionalGeneration]:
+def load_model(backend: str = "torch") -> tuple[BlipProcessor, BlipForConditionalGeneration]:
     """
     Load the pretrained BLIP processor and model for image captioning.
     
+    Args:
+        backend: "torch" for eager PyTorch, or "onnx" / "onnx-int8" for the
+            models exported by export_onnx.py.
+    
     Returns:
         tuple: The processor and model instances.
     """
     processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-    model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+    model = load_blip("Salesforce/blip-image-captioning-base", backend)
     return processor, model
 
 
-def get_image_paths(directory: str, extensions: List[str]) -> List[str]:
+def get_image_paths(directory: str, extensions: List[str], recursive: bool = True) -> List[str]:
     """
     Get all image file paths from a directory matching the given extensions.
     
     Args:
         directory: The directory to search for images.
-        extensions: List of image file extensions to include.
+        extensions: List of image file extensions to include (case-insensitive).
+        recursive: Whether to search sub directories as well.
         
     Returns:
-        List[str]: List of image file paths.
+        List[str]: Sorted list of image file paths.
     """
+    suffixes = tuple(f".{ext.lower()}" for ext in extensions)
     image_paths = []
-    for ext in extensions:
-        image_paths.extend(glob.glob(os.path.join(directory, f"*.{ext}")))
-    return image_paths
+    for root, dirs, files in os.walk(directory):
+        if not recursive:
+            dirs.clear()
+        image_paths.extend(
+            os.path.join(root, name) for name in files if name.lower().endswith(suffixes)
+        )
+    return sorted(image_paths)
+
+
+def file_signature(img_path: str, use_hash: bool = False) -> Dict:
+    """
+    Describe the current state of a file for change detection.
+    
+    Args:
+        img_path: Path of the image file.
+        use_hash: Whether to include the SHA-256 of the file contents.
+        
+    Returns:
+        Dict: The file's size, mtime and, with use_hash, its sha256.
+    """
+    stat = os.stat(img_path)
+    signature = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if use_hash:
+        digest = hashlib.sha256()
+        with open(img_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        signature["sha256"] = digest.hexdigest()
+    return signature
+
+
+def load_manifest(output_file: str) -> Dict[str, Dict]:
+    """
+    Read the records of previous runs from a JSONL caption file.
+    
+    Later records for the same path replace earlier ones, and a truncated
+    last line left by a crash is ignored.
+    
+    Args:
+        output_file: Path of the JSONL caption file.
+        
+    Returns:
+        Dict[str, Dict]: The latest record for each image path.
+    """
+    manifest = {}
+    if not os.path.exists(output_file):
+        return manifest
+    with open(output_file, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            manifest[record["path"]] = record
+    return manifest
+
+
+def is_unchanged(record: Optional[Dict], signature: Dict) -> bool:
+    """
+    Check whether a manifest record still describes the file on disk.
+    
+    Args:
+        record: The manifest record of the file, if any.
+        signature: The file's current signature from file_signature.
+        
+    Returns:
+        bool: True if the file's size and mtime (or content hash) match.
+    """
+    if record is None:
+        return False
+    if "sha256" in signature and record.get("sha256") == signature["sha256"]:
+        return True
+    return record.get("size") == signature["size"] and record.get("mtime") == signature["mtime"]
 
 
-def generate_caption(
-    image: Image.Image,
+class ImageDataset(Dataset):
+    """
+    Dataset of image files, decoded and preprocessed to BLIP pixel values.
+    
+    Files that cannot be read are returned with their error instead of
+    raising, so one broken image does not stop a worker or its batch.
+    """
+
+    def __init__(self, image_paths: List[str], image_processor: BlipImageProcessor):
+        self.image_paths = image_paths
+        self.image_processor = image_processor
+
+    def __len__(self) -> int:
+        return len(self.image_paths)
+
+    def __getitem__(self, index: int) -> Tuple[str, Optional[torch.Tensor], Optional[str]]:
+        img_path = self.image_paths[index]
+        try:
+            raw_image = load_image(img_path, BLIP_INPUT_SIZE)
+            pixel_values = self.image_processor(raw_image, return_tensors="pt")["pixel_values"][0]
+            return img_path, pixel_values, None
+        except Exception as e:
+            return img_path, None, str(e)
+
+
+def collate_images(
+    items: List[Tuple[str, Optional[torch.Tensor], Optional[str]]]
+) -> Tuple[List[str], Optional[torch.Tensor], List[Tuple[str, str]]]:
+    """
+    Stack the decoded images of a batch and set aside the ones that failed.
+    
+    Args:
+        items: (path, pixel values, error) tuples from ImageDataset.
+        
+    Returns:
+        tuple: The paths of the decoded images, their stacked pixel values
+            (None if none decoded) and the (path, error) pairs of failed files.
+    """
+    paths = [path for path, pixel_values, _ in items if pixel_values is not None]
+    pixel_values = [pixel_values for _, pixel_values, _ in items if pixel_values is not None]
+    errors = [(path, error) for path, pixel_values, error in items if pixel_values is None]
+    return paths, torch.stack(pixel_values) if pixel_values else None, errors
+
+
+def generate_captions(
+    pixel_values: torch.Tensor,
     processor: BlipProcessor,
     model: BlipForConditionalGeneration,
     max_new_tokens: int = 50
-) -> str:
+) -> List[str]:
     """
-    Generate a caption for the given image using the BLIP model.
+    Generate captions for a batch of preprocessed images in one generate call.
     
     Args:
-        image: The input PIL Image.
+        pixel_values: Stacked BLIP pixel values of the images.
         processor: The BLIP processor instance.
         model: The BLIP model instance.
         max_new_tokens: Maximum number of tokens to generate.
         
     Returns:
-        str: The generated image caption.
+        List[str]: The generated captions, in the order of the images.
     """
-    inputs = processor(image, return_tensors="pt")
-    out = model.generate(**inputs, max_new_tokens=max_new_tokens)
-    caption = processor.decode(out[0], skip_special_tokens=True)
-    return caption
+    with torch.inference_mode():
+        out = model.generate(pixel_values=pixel_values, max_new_tokens=max_new_tokens)
+    return processor.batch_decode(out, skip_special_tokens=True)
+
+
+def write_records(caption_file, records: List[Dict]) -> None:
+    """
+    Append records to the caption file and flush them to disk.
+    
+    Args:
+        caption_file: The open JSONL caption file.
+        records: The records to append.
+    """
+    for record in records:
+        caption_file.write(json.dumps(record) + "\n")
+    caption_file.flush()
+    os.fsync(caption_file.fileno())
+
+
+def compact_manifest(output_file: str, image_paths: List[str], image_dir: str) -> None:
+    """
+    Rewrite the caption file with one record per image that still exists.
+    
+    Args:
+        output_file: Path of the JSONL caption file.
+        image_paths: The image paths found in this run.
+        image_dir: The directory the record paths are relative to.
+    """
+    manifest = load_manifest(output_file)
+    temp_file = f"{output_file}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        for img_path in image_paths:
+            record = manifest.get(os.path.relpath(img_path, image_dir))
+            if record is not None:
+                f.write(json.dumps(record) + "\n")
+    os.replace(temp_file, output_file)
 
 
 def process_images(
     image_dir: str,
     output_file: str,
-    extensions: List[str] = ["jpg", "jpeg", "png"]
+    extensions: List[str] = ["jpg", "jpeg", "png"],
+    batch_size: int = BATCH_SIZE,
+    num_workers: int = NUM_WORKERS,
+    recursive: bool = True,
+    use_hash: bool = False,
+    retry_errors: bool = False,
+    backend: str = "torch"
 ) -> None:
     """
-    Process all images in a directory, generate captions, and write to file.
+    Caption the new and changed images in a directory and record them.
+    
+    Images already in the output file with an unchanged size and mtime (or,
+    with use_hash, unchanged contents) are skipped. The rest are decoded and
+    preprocessed by a pool of DataLoader workers and captioned batch by
+    batch; every batch is appended to the output file in path order as soon
+    as it is done, so an interrupted run can be resumed.
     
     Args:
         image_dir: Directory containing the images to process.
-        output_file: Path to the output file for captions.
+        output_file: Path to the JSONL output file for captions.
         extensions: List of image file extensions to process.
+        batch_size: Number of images captioned per generate call.
+        num_workers: Number of worker processes loading images.
+        recursive: Whether to include images in sub directories.
+        use_hash: Whether to detect changes by content hash, which also
+            reuses captions of files that were moved or only touched.
+        retry_errors: Whether to retry images that failed in earlier runs.
+        backend: Inference backend, one of onnx_backend.BACKENDS.
     """
-    processor, model = load_model()
-    image_paths = get_image_paths(image_dir, extensions)
+    image_paths = get_image_paths(image_dir, extensions, recursive)
+    manifest = load_manifest(output_file)
+    captions_by_hash = {
+        record["sha256"]: record["caption"]
+        for record in manifest.values()
+        if record.get("sha256") and record.get("caption") is not None
+    }
     
-    with open(output_file, "w") as caption_file:
-        for img_path in image_paths:
-            try:
-                raw_image = Image.open(img_path).convert("RGB")
-                caption = generate_caption(raw_image, processor, model)
-                caption_file.write(f"{os.path.basename(img_path)}: {caption}\n")
-                print(f"Processed: {os.path.basename(img_path)}")
-            except Exception as e:
-                print(f"Error processing {img_path}: {e}")
+    todo = []
+    signatures = {}
+    reused = []
+    for img_path in image_paths:
+        key = os.path.relpath(img_path, image_dir)
+        try:
+            signature = file_signature(img_path, use_hash)
+        except OSError as e:
+            print(f"Error reading {img_path}: {e}")
+            continue
+        record = manifest.get(key)
+        if is_unchanged(record, signature) and (not retry_errors or "error" not in record):
+            if record.get("mtime") != signature["mtime"]:
+                # Same contents under a new mtime: refresh the record, keep the caption
+                reused.append(dict(record, **signature))
+            continue
+        if signature.get("sha256") in captions_by_hash:
+            reused.append({"path": key, **signature, "caption": captions_by_hash[signature["sha256"]]})
+            continue
+        todo.append(img_path)
+        signatures[img_path] = signature
+    
+    print(f"{len(image_paths)} images: {len(todo)} to caption, {len(image_paths) - len(todo)} unchanged")
+    
+    # A crash while writing can leave a partial last line; append after it
+    needs_newline = False
+    if os.path.exists(output_file) and os.path.getsize(output_file):
+        with open(output_file, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    
+    with open(output_file, "a", encoding="utf-8") as caption_file:
+        if needs_newline:
+            caption_file.write("\n")
+        write_records(caption_file, reused)
+        
+        if todo:
+            processor, model = load_model(backend)
+            loader = DataLoader(
+                ImageDataset(todo, processor.image_processor),
+                batch_size=batch_size,
+                num_workers=min(num_workers, len(todo)),
+                collate_fn=collate_images
+            )
+            
+            for paths, pixel_values, errors in loader:
+                results = {img_path: {"error": error} for img_path, error in errors}
+                if pixel_values is not None:
+                    try:
+                        captions = generate_captions(pixel_values, processor, model)
+                        results.update({img_path: {"caption": caption} for img_path, caption in zip(paths, captions)})
+                    except Exception as e:
+                        # Fall back to one image at a time so only the failing files are lost
+                        print(f"Error captioning batch, retrying images one by one: {e}")
+                        for index, img_path in enumerate(paths):
+                            try:
+                                caption = generate_captions(pixel_values[index:index + 1], processor, model)[0]
+                                results[img_path] = {"caption": caption}
+                            except Exception as e:
+                                results[img_path] = {"error": str(e)}
+                
+                records = []
+                for img_path in sorted(results):
+                    result = results[img_path]
+                    if "error" in result:
+                        print(f"Error processing {img_path}: {result['error']}")
+                    else:
+                        print(f"Processed: {img_path}")
+                    records.append({"path": os.path.relpath(img_path, image_dir), **signatures[img_path], **result})
+                write_records(caption_file, records)
+    
+    # Drop superseded records and images that no longer exist
+    compact_manifest(output_file, image_paths, image_dir)
 
 
 def main() -> None:
     """Main entry point for the image captioning script."""
-    image_dir = "/home/dave/Documents/CODE/AI_Powered_Python_Apps/Blip"
-    output_file = "localcaptions.txt"
+    parser = argparse.ArgumentParser(description="Caption a directory of images with BLIP")
+    parser.add_argument("image_dir", help="Directory containing the images")
+    parser.add_argument("--output", default="localcaptions.jsonl", help="JSONL caption file, also used as manifest")
+    parser.add_argument("--extensions", nargs="+", default=["jpg", "jpeg", "png"])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS, help="Image loading worker processes")
+    parser.add_argument("--no-recursive", action="store_true", help="Only caption the top level of image_dir")
+    parser.add_argument("--hash", action="store_true", help="Detect changes by content hash instead of size and mtime")
+    parser.add_argument("--retry-errors", action="store_true", help="Retry images that failed in earlier runs")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch", help="Inference backend")
+    parser.add_argument("--index", metavar="INDEX_DIR", help="Also update the caption search index in INDEX_DIR")
+    args = parser.parse_args()
+    
+    process_images(
+        args.image_dir,
+        args.output,
+        extensions=args.extensions,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        recursive=not args.no_recursive,
+        use_hash=args.hash,
+        retry_errors=args.retry_errors,
+        backend=args.backend
+    )
+    print(f"Captions saved to {args.output}")
     
-    process_images(image_dir, output_file)
-    print(f"Captions saved to {output_file}")
+    if args.index:
+        from caption_index import build_index
+        embedded = build_index(args.output, args.index)
+        print(f"Search index updated in {args.index} ({embedded} captions embedded)")
 
 
 if __name__ == "__main__":
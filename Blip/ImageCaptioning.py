@@ -4,37 +4,85 @@ Image Captioning Web Interface using BLIP and Gradio.
 This script sets up a Gradio web interface that utilizes the Salesforce BLIP 
 (Bootstrapped Language-Image Pre-training) model to generate captions for 
 uploaded images.
+
+Requests are served in Gradio's batched mode: images uploaded by concurrent
+users are collected into batches of up to MAX_BATCH_SIZE and captioned with
+a single generate call.
+
+Set BLIP_BACKEND=onnx or BLIP_BACKEND=onnx-int8 to run the models exported
+by export_onnx.py on ONNX Runtime instead of eager PyTorch.
 """
+import os
+from typing import List, Union
+
 import gradio as gr
-from transformers import BlipProcessor, BlipForConditionalGeneration
+import torch
+from transformers import BlipProcessor
 from PIL import Image
+from onnx_backend import load_blip
+from image_loader import BLIP_INPUT_SIZE, load_image
+
+# Largest batch Gradio collects from queued requests, the number of batches
+# run at the same time, and the number of requests allowed to wait.
+MAX_BATCH_SIZE = 8
+CONCURRENCY_LIMIT = 1
+QUEUE_MAX_SIZE = 64
+
+MODEL_NAME = "Salesforce/blip-image-captioning-base"
+BACKEND = os.getenv("BLIP_BACKEND", "torch")
 
 # Load model and processor globally to ensure they are loaded only once.
 # Using the "base" version of the BLIP model for a balance of speed and accuracy.
-processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
-model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base")
+processor = BlipProcessor.from_pretrained(MODEL_NAME)
+model = load_blip(MODEL_NAME, BACKEND)
 
 
-def caption_image(image: Image.Image) -> str:
+def caption_image(image: Union[str, Image.Image]) -> str:
     """
-    Process a PIL Image to generate a descriptive caption using the BLIP model.
+    Process an image to generate a descriptive caption using the BLIP model.
 
     Args:
-        image (PIL.Image.Image): The input image object to be analyzed.
+        image (str | PIL.Image.Image): The image file path or image object
+            to be analyzed. Files are decoded at reduced resolution.
 
     Returns:
         str: The predicted text caption for the image. Returns an error message 
              string if an exception occurs during processing.
     """
     try:
-        inputs = processor(images=image, return_tensors="pt")
-        outputs = model.generate(**inputs)
+        inputs = processor(images=load_image(image, BLIP_INPUT_SIZE), return_tensors="pt")
+        with torch.inference_mode():
+            outputs = model.generate(**inputs)
         caption = processor.decode(outputs[0], skip_special_tokens=True)
         return caption
     except Exception as e:
         return f"An error occurred: {e}"
 
 
+def caption_images(images: List[Union[str, Image.Image]]) -> List[List[str]]:
+    """
+    Caption a batch of images with one generate call (Gradio batch mode).
+
+    Args:
+        images (List[str | PIL.Image.Image]): The uploaded files (or image
+            objects) of the queued requests.
+
+    Returns:
+        List[List[str]]: One list per output component, holding a caption
+             (or error message) for every image, in request order. If the
+             batched call fails, the images are captioned one at a time so
+             a single bad image only fails its own request.
+    """
+    try:
+        inputs = processor(images=[load_image(image, BLIP_INPUT_SIZE) for image in images], return_tensors="pt")
+        with torch.inference_mode():
+            outputs = model.generate(**inputs)
+        captions = processor.batch_decode(outputs, skip_special_tokens=True)
+    except Exception:
+        captions = [caption_image(image) for image in images]
+    return [captions]
+
+
 def main() -> None:
     """
     Initializes and launches the Gradio interface for image captioning.
@@ -43,13 +91,19 @@ def main() -> None:
     It runs locally on 127.0.0.1 at port 7860.
     """
     iface = gr.Interface(
-        fn=caption_image,
-        inputs=gr.Image(type="pil"),
+        fn=caption_images,
+        # Gradio passes the uploaded file path, so the image is decoded once,
+        # at reduced resolution, by load_image
+        inputs=gr.Image(type="filepath"),
         outputs="text",
         title="Image Captioning with BLIP",
-        description="Upload an image to generate a caption using the Salesforce BLIP model."
+        description="Upload an image to generate a caption using the Salesforce BLIP model.",
+        batch=True,
+        max_batch_size=MAX_BATCH_SIZE,
+        concurrency_limit=CONCURRENCY_LIMIT
     )
 
+    iface.queue(max_size=QUEUE_MAX_SIZE)
     iface.launch(server_name="127.0.0.1", server_port=7860)
 
 
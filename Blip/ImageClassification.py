@@ -8,51 +8,120 @@ by the user into one of 1000 ImageNet categories.
 Usage:
     Run the script to launch a local web server. Upload an image via the UI
     to view the top 3 classification predictions.
+
+Requests are served in Gradio's batched mode: images uploaded by concurrent
+users are collected into batches of up to MAX_BATCH_SIZE and classified with
+a single forward pass.
+
+Set BLIP_BACKEND=onnx or BLIP_BACKEND=onnx-int8 to run the model exported
+by export_onnx.py on ONNX Runtime instead of eager PyTorch.
 """
+import os
+from typing import List, Union
+
 import torch
-import requests
 from PIL import Image
 from torchvision import transforms
+from torchvision.models import ResNet18_Weights
 import gradio as gr
+from onnx_backend import load_resnet
+from image_loader import RESNET_INPUT_SIZE, load_image
+
+# Number of classes returned per image (the UI shows this many).
+TOP_K = 3
+
+# Largest batch Gradio collects from queued requests, the number of batches
+# run at the same time, and the number of requests allowed to wait.
+MAX_BATCH_SIZE = 16
+CONCURRENCY_LIMIT = 1
+QUEUE_MAX_SIZE = 64
+
+BACKEND = os.getenv("BLIP_BACKEND", "torch")
+
+# Load pre-trained ResNet-18 model and set to evaluation mode. These are the
+# same ImageNet weights torch.hub served for 'resnet18', pretrained=True.
+weights = ResNet18_Weights.IMAGENET1K_V1
+model = load_resnet(BACKEND)
 
-# Load pre-trained ResNet-18 model and set to evaluation mode.
-model = torch.hub.load('pytorch/vision:v0.6.0', 'resnet18', pretrained=True).eval()
+# Human-readable ImageNet labels ship with the torchvision weights, so no
+# network access is needed at startup.
+labels = weights.meta["categories"]
 
-# Download human-readable labels for ImageNet classes.
-response = requests.get("https://git.io/JJkYN")
-labels = response.text.split("\n")
+# Standard ImageNet preprocessing: the network always sees a 224x224 crop,
+# however large the uploaded photo is.
+preprocess = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+])
 
-def predict(inp):
-    """Predicts the class probabilities of an input image.
+def predict(inp: Union[str, Image.Image], k: int = TOP_K) -> dict:
+    """Predicts the most likely classes of an input image.
 
     Args:
-        inp (PIL.Image.Image): The input image to be classified.
+        inp (str | PIL.Image.Image): The image file path or image object to
+            be classified.
+        k (int): Number of top classes to return.
 
     Returns:
-        dict: A dictionary mapping all 1000 ImageNet labels to their 
-              corresponding confidence probabilities.
+        dict: A dictionary mapping the k most likely ImageNet labels to
+              their confidence probabilities (or an error message if the
+              image cannot be read).
     """
-    inp = transforms.ToTensor()(inp).unsqueeze(0)
-    with torch.no_grad():
-        prediction = torch.nn.functional.softmax(model(inp)[0], dim=0)
-        confidences = {labels[i]: float(prediction[i]) for i in range(1000)}
-        return confidences
+    return predict_batch([inp], k)[0][0]
+
+def predict_batch(images: List[Union[str, Image.Image]], k: int = TOP_K) -> List[List[dict]]:
+    """Predicts the most likely classes of a batch of images in one forward pass.
+
+    Args:
+        images (List[str | PIL.Image.Image]): The uploaded files (or image
+              objects) of the queued requests, decoded at reduced resolution.
+        k (int): Number of top classes to return per image.
+
+    Returns:
+        List[List[dict]]: One list per output component (Gradio batch mode),
+              holding a label -> confidence dict per image in request order.
+              An image that cannot be decoded gets an error message instead,
+              so it only fails its own request.
+    """
+    results = [None] * len(images)
+    tensors = []
+    for index, image in enumerate(images):
+        try:
+            tensors.append((index, preprocess(load_image(image, RESNET_INPUT_SIZE))))
+        except Exception as e:
+            results[index] = f"Error: could not read image ({e})"
+
+    if tensors:
+        batch = torch.stack([tensor for _, tensor in tensors])
+        with torch.inference_mode():
+            prediction = torch.nn.functional.softmax(model(batch), dim=1)
+            top = torch.topk(prediction, k, dim=1)
+        for (index, _), values, indices in zip(tensors, top.values.tolist(), top.indices.tolist()):
+            results[index] = {labels[i]: p for p, i in zip(values, indices)}
+    return [results]
 
 def main():
     """Configures and launches the Gradio interface."""
     
     # Create the Gradio interface.
-    # Inputs: Image upload (type="pil" ensures compatibility with transforms).
+    # Inputs: Image upload, passed as a file path so load_image can decode
+    # it directly at reduced resolution.
     # Outputs: Label display showing the top 3 most likely classes.
     interface = gr.Interface(
-        fn=predict,
-        inputs=gr.Image(type="pil"),
-        outputs=gr.Label(num_top_classes=3),
+        fn=predict_batch,
+        inputs=gr.Image(type="filepath"),
+        outputs=gr.Label(num_top_classes=TOP_K),
         title="Image Classification with BLIP",
-        examples=["bird.jpg", "house.jpg"]
+        examples=["bird.jpg", "house.jpg"],
+        batch=True,
+        max_batch_size=MAX_BATCH_SIZE,
+        concurrency_limit=CONCURRENCY_LIMIT
     )
     
     # Launch the interface.
+    interface.queue(max_size=QUEUE_MAX_SIZE)
     interface.launch()
 
 if __name__ == "__main__":
@@ -2,9 +2,17 @@
 Web scraper and image caption generator using BLIP model.
 
 When executed, this script:
-1. Scrapes all images from BASE_URL
-2. Uses the BLIP model to generate captions
-3. Saves results to OUTPUT_FILE
+1. Scrapes all images from BASE_URL (or the URL given on the command line)
+2. Downloads them concurrently over a pooled HTTP session, stopping as soon
+   as the image header shows an image is too small
+3. Uses the BLIP model to generate captions in batches while the
+   remaining images are still downloading
+4. Saves results to OUTPUT_FILE in page order
+
+Images seen on earlier runs are kept in CACHE_FILE with their ETag,
+Last-Modified date, content hash and caption. Repeat crawls send
+conditional requests, so unchanged images are neither downloaded again nor
+re-captioned, and identical images at different URLs share one caption.
 
 Constants:
     MODEL_NAME: HuggingFace model for image captioning
@@ -13,14 +21,31 @@ Constants:
     MIN_IMAGE_PIXELS: Minimum resolution threshold
     OUTPUT_FILE: Path to save generated captions
     TIMEOUT: HTTP request timeout in seconds
+    FETCH_WORKERS: Concurrent image downloads
+    BATCH_SIZE: Images captioned per generate call
+    QUEUE_SIZE: Downloaded images waiting to be captioned
+    CACHE_FILE: Path of the URL -> caption cache
+    CHUNK_SIZE: Bytes read per step while probing an image's dimensions
 """
 
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
 import requests
+import torch
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
-from PIL import Image
-from transformers import AutoProcessor, BlipForConditionalGeneration
+from PIL import Image, ImageFile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from transformers import AutoProcessor
+from onnx_backend import BACKENDS, load_blip
+from image_loader import BLIP_INPUT_SIZE, load_image
 
 # Constants
 MODEL_NAME = "Salesforce/blip-image-captioning-base"
@@ -29,21 +54,43 @@ HEADERS = {"User-Agent": "Mozilla/5.0"}
 MIN_IMAGE_PIXELS = 200
 OUTPUT_FILE = "captions.txt"
 TIMEOUT = 10
+FETCH_WORKERS = 8
+BATCH_SIZE = 8
+QUEUE_SIZE = 32
+CACHE_FILE = "captions_cache.json"
+CHUNK_SIZE = 16 * 1024
+
+# Marks the end of the download stream on the image queue
+_DONE = object()
 
 
-def load_model():
-    """Load the BLIP model and processor."""
+def load_model(backend: str = "torch"):
+    """Load the BLIP model and processor (torch, onnx or onnx-int8 backend)."""
     processor = AutoProcessor.from_pretrained(MODEL_NAME)
-    model = BlipForConditionalGeneration.from_pretrained(MODEL_NAME)
+    model = load_blip(MODEL_NAME, backend)
     return processor, model
 
 
-def normalize_url(img_url: str) -> str | None:
+def create_session(pool_size: int = FETCH_WORKERS) -> requests.Session:
+    """Create an HTTP session that keeps pool_size connections per host alive."""
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=2, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def normalize_url(img_url: str, base_url: str = BASE_URL) -> str | None:
     """Convert relative URLs to absolute."""
     if img_url.startswith("//"):
         return "https:" + img_url
     if img_url.startswith("/"):
-        return urljoin(BASE_URL, img_url)
+        return urljoin(base_url, img_url)
     if img_url.startswith("http"):
         return img_url
     return None
@@ -51,49 +98,283 @@ def normalize_url(img_url: str) -> str | None:
 
 def should_skip_url(url: str) -> bool:
     """Check if URL should be skipped (SVGs, invalid formats)."""
-    return not url or ".svg" in url
+    return not url or urlparse(url).path.lower().endswith(".svg")
+
+
+class CaptionCache:
+    """
+    On-disk cache of image URL -> ETag / Last-Modified / content hash / caption.
+
+    Images that turned out too small are cached as well (with caption None),
+    so they are not probed again while they are unchanged.
+    """
 
+    def __init__(self, path: str = CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        self._by_hash = {
+            entry["sha256"]: entry["caption"]
+            for entry in self._entries.values()
+            if entry.get("sha256") and entry.get("caption")
+        }
 
-def generate_caption(image_url: str, processor, model) -> str | None:
-    """Download image and generate caption."""
+    def get(self, url: str) -> dict | None:
+        with self._lock:
+            return self._entries.get(url)
+
+    def caption_for_hash(self, sha256: str) -> str | None:
+        with self._lock:
+            return self._by_hash.get(sha256)
+
+    def put(self, url: str, entry: dict) -> None:
+        with self._lock:
+            self._entries[url] = entry
+            if entry.get("sha256") and entry.get("caption"):
+                self._by_hash[entry["sha256"]] = entry["caption"]
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps(self._entries, indent=1)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+
+def find_image_urls(session: requests.Session, page_url: str) -> list[str]:
+    """Return the absolute URLs of the images on a page, in page order."""
+    response = session.get(page_url, timeout=TIMEOUT)
+    soup = BeautifulSoup(response.text, 'html.parser')
+
+    image_urls = []
+    for img in soup.find_all('img'):
+        img_url = img.attrs.get('data-src') or img.attrs.get('src', '')
+
+        if should_skip_url(img_url):
+            continue
+
+        img_url = normalize_url(img_url, page_url)
+        if img_url:
+            image_urls.append(img_url)
+    return image_urls
+
+
+def conditional_headers(entry: dict | None) -> dict:
+    """Build If-None-Match / If-Modified-Since headers from a cache entry."""
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def fetch_image(session: requests.Session, image_url: str, cache: CaptionCache) -> dict | None:
+    """
+    Download an image unless the cache already has an up-to-date caption.
+
+    The body is streamed through a PIL header parser, and the download stops
+    as soon as the dimensions show the image is below MIN_IMAGE_PIXELS.
+
+    Returns None if the image is unavailable or unusable, otherwise a dict
+    with either a cached "caption" or a decoded "image", plus the "entry" to
+    store in the cache.
+    """
+    cached = cache.get(image_url)
     try:
-        response = requests.get(image_url, timeout=TIMEOUT, headers=HEADERS)
-        raw_image = Image.open(BytesIO(response.content))
-        
+        with session.get(image_url, timeout=TIMEOUT, stream=True,
+                         headers=conditional_headers(cached)) as response:
+            if response.status_code == 304 and cached:
+                if not cached.get("caption"):
+                    return None
+                return {"caption": cached["caption"], "entry": cached}
+            response.raise_for_status()
+
+            content_type = response.headers.get("Content-Type", "")
+            if content_type and (not content_type.startswith("image/") or "svg" in content_type):
+                return None
+
+            entry = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha256": None,
+                "caption": None
+            }
+            parser = ImageFile.Parser()
+            digest = hashlib.sha256()
+            body = BytesIO()
+            size_checked = False
+            for chunk in response.iter_content(CHUNK_SIZE):
+                digest.update(chunk)
+                body.write(chunk)
+                if not size_checked:
+                    parser.feed(chunk)
+                    if parser.image is not None:
+                        size_checked = True
+                        width, height = parser.image.size
+                        if width * height < MIN_IMAGE_PIXELS:
+                            cache.put(image_url, entry)
+                            return None
+
+        entry["sha256"] = digest.hexdigest()
+        caption = cache.caption_for_hash(entry["sha256"])
+        if caption:
+            return {"caption": caption, "entry": dict(entry, caption=caption)}
+
+        body.seek(0)
+        raw_image = Image.open(body)
         if raw_image.size[0] * raw_image.size[1] < MIN_IMAGE_PIXELS:
+            cache.put(image_url, entry)
             return None
-        
-        inputs = processor(images=raw_image.convert("RGB"), 
-                          text="the image of", 
-                          return_tensors="pt")
-        out = model.generate(**inputs, max_new_tokens=50)
-        return processor.decode(out[0], skip_special_tokens=True)
-        
+
+        return {"image": load_image(raw_image, BLIP_INPUT_SIZE), "entry": entry}
+
     except (OSError, requests.RequestException):
         return None
 
 
+def fetch_images(
+    session: requests.Session,
+    image_urls: list[str],
+    images: queue.Queue,
+    cache: CaptionCache,
+    workers: int = FETCH_WORKERS
+) -> None:
+    """
+    Download images concurrently and put (index, url, fetch result) on the queue.
+
+    The queue is bounded, so downloads pause while the captioning stage is
+    behind instead of holding every image in memory. _DONE is put on the
+    queue once all downloads have finished.
+    """
+    def fetch(index: int, image_url: str) -> None:
+        # Every index must reach the queue, even when the fetch fails, or the
+        # in-order writer would wait for it forever
+        fetched = None
+        try:
+            fetched = fetch_image(session, image_url, cache)
+        except Exception as e:
+            print(f"Error fetching {image_url}: {e}")
+        finally:
+            images.put((index, image_url, fetched))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for index, image_url in enumerate(image_urls, start=1):
+                executor.submit(fetch, index, image_url)
+    finally:
+        images.put(_DONE)
+
+
+def caption_batch(images: list[Image.Image], processor, model) -> list[str]:
+    """Generate captions for a batch of images in one generate call."""
+    inputs = processor(images=images,
+                       text=["the image of"] * len(images),
+                       padding=True,
+                       return_tensors="pt")
+    with torch.inference_mode():
+        out = model.generate(**inputs, max_new_tokens=50)
+    return processor.batch_decode(out, skip_special_tokens=True)
+
+
+def next_batch(images: queue.Queue, batch_size: int) -> tuple[list, bool]:
+    """
+    Wait for the next downloaded image, then take whatever else is ready.
+
+    Returns the batch and whether the download stream has ended.
+    """
+    batch = []
+    item = images.get()
+    while item is not _DONE:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            return batch, False
+        try:
+            item = images.get_nowait()
+        except queue.Empty:
+            return batch, False
+    return batch, True
+
+
+def scrape_and_caption(
+    page_url: str,
+    output_file: str,
+    workers: int = FETCH_WORKERS,
+    batch_size: int = BATCH_SIZE,
+    cache_file: str = CACHE_FILE,
+    backend: str = "torch"
+) -> None:
+    """Caption every image on page_url, overlapping downloads with inference."""
+    processor, model = load_model(backend)
+    session = create_session(workers)
+    cache = CaptionCache(cache_file)
+    image_urls = find_image_urls(session, page_url)
+
+    images = queue.Queue(maxsize=QUEUE_SIZE)
+    fetcher = threading.Thread(
+        target=fetch_images, args=(session, image_urls, images, cache, workers), daemon=True
+    )
+    fetcher.start()
+
+    # Downloads complete out of order; captions are written in page order
+    results = {}
+    next_index = 1
+    try:
+        with open(output_file, "w", encoding="utf-8") as f:
+            done = False
+            while not done:
+                batch, done = next_batch(images, batch_size)
+                to_caption = []
+                for index, image_url, fetched in batch:
+                    if fetched is None:
+                        results[index] = None
+                    elif "image" in fetched:
+                        to_caption.append((index, image_url, fetched))
+                    else:
+                        cache.put(image_url, fetched["entry"])
+                        results[index] = (image_url, fetched["caption"])
+
+                if to_caption:
+                    try:
+                        captions = caption_batch([fetched["image"] for _, _, fetched in to_caption], processor, model)
+                    except Exception as e:
+                        print(f"Error captioning batch: {e}")
+                        captions = [None] * len(to_caption)
+                    for (index, image_url, fetched), caption in zip(to_caption, captions):
+                        if caption:
+                            cache.put(image_url, dict(fetched["entry"], caption=caption))
+                        results[index] = (image_url, caption)
+
+                while next_index in results:
+                    result = results.pop(next_index)
+                    if result and result[1]:
+                        f.write(f"{result[0]}: {result[1]}\n")
+                        print(f"[{next_index}] Caption saved")
+                    next_index += 1
+                f.flush()
+    finally:
+        cache.save()
+
+    fetcher.join()
+    session.close()
+
+
 def main():
-    processor, model = load_model()
-    
-    response = requests.get(BASE_URL, headers=HEADERS)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        for idx, img in enumerate(soup.find_all('img'), start=1):
-            img_url = img.attrs.get('data-src') or img.attrs.get('src', '')
-            
-            if should_skip_url(img_url):
-                continue
-            
-            img_url = normalize_url(img_url)
-            if not img_url:
-                continue
-            
-            caption = generate_caption(img_url, processor, model)
-            if caption:
-                f.write(f"{img_url}: {caption}\n")
-                print(f"[{idx}] Caption saved")
+    parser = argparse.ArgumentParser(description="Caption the images on a web page with BLIP")
+    parser.add_argument("--url", default=BASE_URL, help="Page to scrape images from")
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--workers", type=int, default=FETCH_WORKERS, help="Concurrent image downloads")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Images captioned per generate call")
+    parser.add_argument("--cache", default=CACHE_FILE, help="URL -> caption cache file")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch", help="Inference backend")
+    args = parser.parse_args()
+
+    scrape_and_caption(args.url, args.output, args.workers, args.batch_size, args.cache, args.backend)
 
 
 if __name__ == "__main__":
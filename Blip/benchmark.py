@@ -0,0 +1,341 @@
+"""
+Micro-benchmarks for the Blip image apps.
+
+Usage:
+    python benchmark.py classify [--runs 10] [--raw]
+    python benchmark.py batch [--runs 5] [--caption]
+    python benchmark.py backends [--runs 5] [--backends torch onnx onnx-int8]
+    python benchmark.py decode [--runs 5] [--image photo.jpg]
+
+The classify benchmark times ImageClassification.predict on synthetic images
+from thumbnail size up to a 48 megapixel photo. With --raw it also times the
+old path that ran ResNet-18 on the unresized image, for comparison (slow for
+the largest sizes).
+
+The batch benchmark measures throughput of the batched Gradio handlers
+(ImageClassification.predict_batch, and with --caption also
+ImageCaptioning.caption_images) for increasing batch sizes.
+
+The backends benchmark compares eager PyTorch with the ONNX Runtime models
+from export_onnx.py on the bundled bird.jpg and house.jpg: captioning and
+classification latency, peak memory (each backend runs in its own process)
+and agreement of the captions and top classes with PyTorch.
+
+The decode benchmark compares a full resolution Image.open().convert("RGB")
+with image_loader.load_image on a large JPEG (a generated 24 megapixel
+photo unless --image is given): decode time and peak memory, each mode in
+its own process.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import resource
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+# (width, height) of the synthetic test images
+IMAGE_SIZES = [(224, 224), (640, 480), (1920, 1080), (4000, 3000), (8000, 6000)]
+
+# Batch sizes compared by the batch benchmark
+BATCH_SIZES = [1, 2, 4, 8, 16]
+
+# Bundled sample images used by the backends benchmark
+SAMPLE_IMAGES = ["bird.jpg", "house.jpg"]
+
+# Size of the generated photo used by the decode benchmark (24 megapixels)
+DECODE_IMAGE_SIZE = (6000, 4000)
+
+
+def synthetic_image(width: int, height: int) -> Image.Image:
+    """
+    Create a random RGB test image.
+
+    Args:
+        width: Image width in pixels.
+        height: Image height in pixels.
+
+    Returns:
+        Image.Image: The generated image.
+    """
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def time_call(fn: Callable[[], object], runs: int) -> Tuple[float, float]:
+    """
+    Time a function after one warm-up call.
+
+    Args:
+        fn: The function to time.
+        runs: Number of timed calls.
+
+    Returns:
+        tuple: Median and best latency in milliseconds.
+    """
+    fn()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return statistics.median(latencies), min(latencies)
+
+
+def benchmark_classify(runs: int, raw: bool) -> None:
+    """
+    Print predict() latency per input size.
+
+    Args:
+        runs: Number of timed calls per size.
+        raw: Whether to also time the model on the unresized image.
+    """
+    import ImageClassification
+
+    def predict_raw(image: Image.Image) -> None:
+        with torch.inference_mode():
+            ImageClassification.model(transforms.ToTensor()(image).unsqueeze(0))
+
+    rows: List[str] = []
+    for width, height in IMAGE_SIZES:
+        image = synthetic_image(width, height)
+        median, best = time_call(lambda: ImageClassification.predict(image), runs)
+        size = f"{width}x{height}"
+        row = f"{size:<16}{median:>12.1f}{best:>12.1f}"
+        if raw:
+            raw_median, _ = time_call(lambda: predict_raw(image), max(1, runs // 5))
+            row += f"{raw_median:>14.1f}"
+        rows.append(row)
+
+    header = f"{'input':<16}{'median ms':>12}{'best ms':>12}"
+    if raw:
+        header += f"{'raw median ms':>14}"
+    print(header)
+    print("\n".join(rows))
+
+
+def benchmark_batch(runs: int, caption: bool) -> None:
+    """
+    Print images per second of the batched handlers per batch size.
+
+    Args:
+        runs: Number of timed calls per batch size.
+        caption: Whether to benchmark BLIP captioning as well.
+    """
+    import ImageClassification
+    handlers = [("classify", ImageClassification.predict_batch)]
+    if caption:
+        import ImageCaptioning
+        handlers.append(("caption", ImageCaptioning.caption_images))
+
+    image = synthetic_image(640, 480)
+    print(f"{'handler':<12}{'batch':>8}{'batch ms':>12}{'images/s':>12}")
+    for name, handler in handlers:
+        for batch_size in BATCH_SIZES:
+            images = [image] * batch_size
+            median, _ = time_call(lambda: handler(images), runs)
+            print(f"{name:<12}{batch_size:>8}{median:>12.1f}{batch_size / median * 1000:>12.1f}")
+
+
+def _run_backend(backend: str, runs: int, results) -> None:
+    """
+    Caption and classify the sample images with one backend (in a subprocess).
+
+    Args:
+        backend: One of onnx_backend.BACKENDS.
+        runs: Number of timed calls per image.
+        results: Queue to put the measurements on.
+    """
+    from torchvision.models import ResNet18_Weights
+    from transformers import BlipProcessor
+    from onnx_backend import load_blip, load_resnet
+
+    # The same ImageNet preprocessing as ImageClassification.py, without
+    # importing it (it loads its own model, which would skew peak memory)
+    weights = ResNet18_Weights.IMAGENET1K_V1
+    labels = weights.meta["categories"]
+    preprocess = weights.transforms()
+
+    model_name = "Salesforce/blip-image-captioning-base"
+    processor = BlipProcessor.from_pretrained(model_name)
+    captioner = load_blip(model_name, backend)
+    classifier = load_resnet(backend)
+
+    images = {}
+    for name in SAMPLE_IMAGES:
+        image = Image.open(name).convert("RGB")
+        inputs = processor(images=image, return_tensors="pt")
+        batch = preprocess(image).unsqueeze(0)
+
+        def caption() -> str:
+            with torch.inference_mode():
+                out = captioner.generate(pixel_values=inputs["pixel_values"], max_new_tokens=50)
+            return processor.decode(out[0], skip_special_tokens=True)
+
+        def classify() -> List[Tuple[str, float]]:
+            with torch.inference_mode():
+                probs = torch.nn.functional.softmax(classifier(batch)[0], dim=0)
+            top = torch.topk(probs, 5)
+            return [(labels[i], p) for p, i in zip(top.values.tolist(), top.indices.tolist())]
+
+        caption_ms, _ = time_call(caption, runs)
+        classify_ms, _ = time_call(classify, runs)
+        images[name] = {
+            "caption": caption(),
+            "top5": classify(),
+            "caption_ms": caption_ms,
+            "classify_ms": classify_ms
+        }
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put({"images": images, "peak_mb": peak_mb})
+
+
+def benchmark_backends(runs: int, backends: List[str]) -> None:
+    """
+    Print latency, peak memory and agreement with PyTorch per backend.
+
+    Args:
+        runs: Number of timed calls per image.
+        backends: The backends to compare; "torch" is the reference.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    measurements: Dict[str, Dict] = {}
+    for backend in backends:
+        results = ctx.Queue()
+        process = ctx.Process(target=_run_backend, args=(backend, runs, results))
+        process.start()
+        result = None
+        while result is None and (process.is_alive() or not results.empty()):
+            try:
+                result = results.get(timeout=1)
+            except queue.Empty:
+                pass
+        process.join()
+        if result is None:
+            print(f"{backend}: failed (see error above)")
+            continue
+        measurements[backend] = result
+
+    reference = measurements.get("torch")
+    print(f"{'backend':<12}{'image':<12}{'caption ms':>12}{'classify ms':>13}{'peak MB':>9}{'top-1':>7}{'top-5 dp':>10}  caption")
+    for backend, result in measurements.items():
+        for name, image in result["images"].items():
+            top1 = top5_diff = "-"
+            if reference:
+                expected = reference["images"][name]
+                top1 = "same" if image["top5"][0][0] == expected["top5"][0][0] else "diff"
+                expected_probs = dict(expected["top5"])
+                top5_diff = f"{max(abs(p - expected_probs.get(label, 0.0)) for label, p in image['top5']):.4f}"
+                if image["caption"] != expected["caption"]:
+                    image["caption"] += f"  (torch: {expected['caption']})"
+            print(f"{backend:<12}{name:<12}{image['caption_ms']:>12.1f}{image['classify_ms']:>13.1f}"
+                  f"{result['peak_mb']:>9.0f}{top1:>7}{top5_diff:>10}  {image['caption']}")
+
+
+def _run_decode(mode: str, path: str, runs: int, results) -> None:
+    """
+    Decode an image repeatedly in one mode (in a subprocess).
+
+    Args:
+        mode: "full" for Image.open().convert("RGB"), "blip" or "resnet" for
+            load_image at that model's input size.
+        path: Path of the image file.
+        runs: Number of timed decodes.
+        results: Queue to put the measurements on.
+    """
+    from image_loader import BLIP_INPUT_SIZE, RESNET_INPUT_SIZE, load_image
+
+    if mode == "full":
+        decode = lambda: Image.open(path).convert("RGB")
+    else:
+        min_size = BLIP_INPUT_SIZE if mode == "blip" else RESNET_INPUT_SIZE
+        decode = lambda: load_image(path, min_size)
+
+    size = decode().size
+    median, best = time_call(decode, runs)
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put({"size": size, "median": median, "best": best, "peak_mb": peak_mb})
+
+
+def benchmark_decode(runs: int, image_path: str = None) -> None:
+    """
+    Print decode time and peak memory of full and reduced resolution loading.
+
+    Args:
+        runs: Number of timed decodes per mode.
+        image_path: JPEG to decode; a large photo-like JPEG is generated if None.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if image_path is None:
+            image_path = os.path.join(temp_dir, "large.jpg")
+            width, height = DECODE_IMAGE_SIZE
+            # A smooth gradient with noise compresses like a photo
+            gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+            noise = np.random.default_rng(0).normal(0, 20, (height, width, 3))
+            pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+            Image.fromarray(pixels).save(image_path, quality=90)
+
+        ctx = multiprocessing.get_context("spawn")
+        print(f"{'mode':<10}{'decoded size':>16}{'median ms':>12}{'best ms':>10}{'peak MB':>10}")
+        for mode in ("full", "blip", "resnet"):
+            results = ctx.Queue()
+            process = ctx.Process(target=_run_decode, args=(mode, image_path, runs, results))
+            process.start()
+            result = None
+            while result is None and (process.is_alive() or not results.empty()):
+                try:
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    pass
+            process.join()
+            if result is None:
+                print(f"{mode:<10}failed (see error above)")
+                continue
+            size = "x".join(str(side) for side in result["size"])
+            print(f"{mode:<10}{size:>16}{result['median']:>12.1f}{result['best']:>10.1f}{result['peak_mb']:>10.0f}")
+
+
+def main() -> None:
+    """Parse the command line and run the selected benchmark."""
+    parser = argparse.ArgumentParser(description="Benchmark the Blip image apps")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    classify = subparsers.add_parser("classify", help="ResNet-18 classification latency by input size")
+    classify.add_argument("--runs", type=int, default=10, help="Timed calls per input size")
+    classify.add_argument("--raw", action="store_true", help="Also time the unresized full-resolution path")
+
+    batch = subparsers.add_parser("batch", help="Throughput of the batched Gradio handlers by batch size")
+    batch.add_argument("--runs", type=int, default=5, help="Timed calls per batch size")
+    batch.add_argument("--caption", action="store_true", help="Also benchmark BLIP captioning")
+
+    backends = subparsers.add_parser("backends", help="PyTorch vs ONNX Runtime latency, memory and accuracy")
+    backends.add_argument("--runs", type=int, default=5, help="Timed calls per image")
+    backends.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                          choices=["torch", "onnx", "onnx-int8"])
+
+    decode = subparsers.add_parser("decode", help="Full vs reduced resolution image decoding")
+    decode.add_argument("--runs", type=int, default=5, help="Timed decodes per mode")
+    decode.add_argument("--image", help="JPEG to decode (default: a generated 24 megapixel photo)")
+
+    args = parser.parse_args()
+    if args.command == "classify":
+        benchmark_classify(args.runs, args.raw)
+    elif args.command == "batch":
+        benchmark_batch(args.runs, args.caption)
+    elif args.command == "backends":
+        benchmark_backends(args.runs, args.backends)
+    elif args.command == "decode":
+        benchmark_decode(args.runs, args.image)
+
+
+if __name__ == "__main__":
+    main()
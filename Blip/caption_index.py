@@ -0,0 +1,318 @@
+"""
+Searchable index of image captions.
+
+Usage:
+    python caption_index.py build localcaptions.jsonl [--index-dir caption_index]
+    python caption_index.py search "a bird on a branch" [--index-dir caption_index] [-k 10] [--keyword]
+
+The index is built from the JSONL caption file written by
+CaptionLocalImages.py. Every build writes a new version directory inside
+the index directory and then switches the CURRENT file to it, so a build
+that is interrupted leaves the previous index intact. A version holds:
+    embeddings.npy: L2-normalized caption embeddings, a float16 matrix with
+        one row per image
+    entries.json: the image path and caption of every row
+    vocab.json, postings.npy, offsets.npy: an inverted keyword index, with
+        the rows of each word stored contiguously in postings.npy
+
+Searching loads only the small sentence embedding model (EMBEDDING_MODEL),
+never BLIP, and with --keyword no model at all. Rebuilding reuses the
+embeddings of captions that did not change, so it costs time in proportion
+to the new and changed images.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+from transformers import AutoModel, AutoTokenizer
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+INDEX_DIR = "caption_index"
+EMBED_BATCH_SIZE = 256
+# Rows scored per step, so the float16 matrix is never converted at once
+SCORE_CHUNK_ROWS = 65536
+# Added to the cosine similarity of a row for each query word its caption contains
+KEYWORD_BOOST = 0.1
+STOPWORDS = {"a", "an", "and", "are", "at", "in", "is", "it", "of", "on", "the", "there", "to", "with"}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase keywords, without stopwords.
+
+    Args:
+        text: Caption or query text.
+
+    Returns:
+        List[str]: The keywords, in order of appearance.
+    """
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+
+class CaptionEncoder:
+    """Sentence embedding model (mean pooled, L2-normalized)."""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModel.from_pretrained(model_name).eval()
+
+    def encode(self, texts: List[str], batch_size: int = EMBED_BATCH_SIZE) -> np.ndarray:
+        """
+        Embed texts.
+
+        Args:
+            texts: The texts to embed.
+            batch_size: Texts per forward pass.
+
+        Returns:
+            np.ndarray: float32 matrix with one normalized row per text.
+        """
+        rows = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                    max_length=64, return_tensors="pt")
+            with torch.inference_mode():
+                hidden = self.model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            rows.append(torch.nn.functional.normalize(pooled, dim=1).numpy())
+        if not rows:
+            return np.zeros((0, self.model.config.hidden_size), dtype=np.float32)
+        return np.concatenate(rows)
+
+
+def read_captions(captions_file: str) -> Dict[str, str]:
+    """
+    Read image path -> caption from a CaptionLocalImages.py JSONL file.
+
+    Args:
+        captions_file: Path of the JSONL caption file.
+
+    Returns:
+        Dict[str, str]: The latest caption of every successfully captioned image.
+    """
+    captions = {}
+    with open(captions_file, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("caption"):
+                captions[record["path"]] = record["caption"]
+            else:
+                captions.pop(record["path"], None)
+    return captions
+
+
+def current_dir(index_dir: str = INDEX_DIR) -> str:
+    """
+    Directory holding the files of the current index version.
+
+    Args:
+        index_dir: Directory of the index.
+
+    Returns:
+        str: The version directory named in CURRENT, or index_dir itself for
+            an index without versions.
+    """
+    try:
+        with open(os.path.join(index_dir, "CURRENT"), encoding="utf-8") as f:
+            return os.path.join(index_dir, f.read().strip())
+    except FileNotFoundError:
+        return index_dir
+
+
+def build_index(captions_file: str, index_dir: str = INDEX_DIR, encoder: Optional[CaptionEncoder] = None) -> int:
+    """
+    Build or update the caption index from a JSONL caption file.
+
+    Args:
+        captions_file: Path of the JSONL caption file.
+        index_dir: Directory of the index.
+        encoder: Sentence embedding model, loaded when needed if not given.
+
+    Returns:
+        int: Number of captions that had to be embedded.
+    """
+    captions = read_captions(captions_file)
+    paths = sorted(captions)
+
+    # Reuse the embeddings of unchanged captions from the previous index
+    previous = {}
+    if os.path.exists(os.path.join(current_dir(index_dir), "entries.json")):
+        old_index = CaptionIndex(index_dir)
+        previous = {
+            (entry["path"], entry["caption"]): row for row, entry in enumerate(old_index.entries)
+        }
+        old_embeddings = old_index.embeddings
+
+    missing = [path for path in paths if (path, captions[path]) not in previous]
+    if missing:
+        encoder = encoder or CaptionEncoder()
+        new_embeddings = encoder.encode([captions[path] for path in missing])
+        dimension = new_embeddings.shape[1]
+    else:
+        dimension = old_embeddings.shape[1] if previous else 0
+
+    embeddings = np.zeros((len(paths), dimension), dtype=np.float16)
+    new_rows = {path: row for row, path in enumerate(missing)}
+    for row, path in enumerate(paths):
+        if path in new_rows:
+            embeddings[row] = new_embeddings[new_rows[path]]
+        else:
+            embeddings[row] = old_embeddings[previous[(path, captions[path])]]
+
+    postings: Dict[str, List[int]] = {}
+    for row, path in enumerate(paths):
+        for word in set(tokenize(captions[path])):
+            postings.setdefault(word, []).append(row)
+    vocab = sorted(postings)
+    lengths = np.array([len(postings[word]) for word in vocab], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    flat = np.array([row for word in vocab for row in postings[word]], dtype=np.int32)
+
+    # Write a complete new version next to the current one (whose embeddings
+    # may still be memory-mapped) and switch CURRENT to it in one rename
+    version = f"v{time.time_ns()}"
+    version_dir = os.path.join(index_dir, version)
+    os.makedirs(version_dir)
+    np.save(os.path.join(version_dir, "embeddings.npy"), embeddings)
+    np.save(os.path.join(version_dir, "postings.npy"), flat)
+    np.save(os.path.join(version_dir, "offsets.npy"), offsets)
+    with open(os.path.join(version_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump({word: index for index, word in enumerate(vocab)}, f)
+    with open(os.path.join(version_dir, "entries.json"), "w", encoding="utf-8") as f:
+        json.dump([{"path": path, "caption": captions[path]} for path in paths], f)
+
+    temp_path = os.path.join(index_dir, "CURRENT.tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, os.path.join(index_dir, "CURRENT"))
+
+    # Remove older versions and unfinished builds (open memory maps of a
+    # removed version stay valid until they are closed)
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name != version and name.startswith("v") and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return len(missing)
+
+
+class CaptionIndex:
+    """A built caption index, loaded for searching."""
+
+    def __init__(self, index_dir: str = INDEX_DIR, encoder: Optional[CaptionEncoder] = None):
+        self.index_dir = index_dir
+        self.encoder = encoder
+        files_dir = current_dir(index_dir)
+        # Memory-mapped, so opening the index is instant and its pages are
+        # shared through the OS page cache between search processes
+        self.embeddings = np.load(os.path.join(files_dir, "embeddings.npy"), mmap_mode="r")
+        self.postings = np.load(os.path.join(files_dir, "postings.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(files_dir, "offsets.npy"))
+        with open(os.path.join(files_dir, "vocab.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        with open(os.path.join(files_dir, "entries.json"), encoding="utf-8") as f:
+            self.entries = json.load(f)
+
+    def _rows_with(self, word: str) -> np.ndarray:
+        index = self.vocab.get(word)
+        if index is None:
+            return np.zeros(0, dtype=np.int32)
+        return np.asarray(self.postings[self.offsets[index]:self.offsets[index + 1]])
+
+    def keyword_search(self, query: str, k: int = 10) -> List[Dict]:
+        """
+        Find the images whose caption contains every keyword of the query.
+
+        Args:
+            query: Search words.
+            k: Maximum number of results.
+
+        Returns:
+            List[Dict]: path, caption and score of the matches.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        rows = self._rows_with(words[0])
+        for word in words[1:]:
+            rows = np.intersect1d(rows, self._rows_with(word), assume_unique=True)
+        return [dict(self.entries[row], score=1.0) for row in rows[:k].tolist()]
+
+    def search(self, query: str, k: int = 10) -> List[Dict]:
+        """
+        Rank all images by caption similarity to the query.
+
+        The score is the cosine similarity of the caption and query
+        embeddings plus KEYWORD_BOOST for every query keyword in the caption.
+
+        Args:
+            query: Natural language query.
+            k: Number of results.
+
+        Returns:
+            List[Dict]: path, caption and score of the top k images.
+        """
+        if len(self.entries) == 0:
+            return []
+        if self.encoder is None:
+            self.encoder = CaptionEncoder()
+        query_embedding = self.encoder.encode([query])[0]
+
+        scores = np.empty(len(self.entries), dtype=np.float32)
+        for start in range(0, len(self.entries), SCORE_CHUNK_ROWS):
+            chunk = np.asarray(self.embeddings[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ query_embedding
+        for word in set(tokenize(query)):
+            scores[self._rows_with(word)] += KEYWORD_BOOST
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self.entries[row], score=float(scores[row])) for row in top.tolist()]
+
+
+def main() -> None:
+    """Parse the command line and build or search the index."""
+    parser = argparse.ArgumentParser(description="Build and search the caption index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build or update the index from a JSONL caption file")
+    build.add_argument("captions_file", help="JSONL caption file written by CaptionLocalImages.py")
+    build.add_argument("--index-dir", default=INDEX_DIR)
+
+    search = subparsers.add_parser("search", help="Search the index")
+    search.add_argument("query")
+    search.add_argument("--index-dir", default=INDEX_DIR)
+    search.add_argument("-k", type=int, default=10, help="Number of results")
+    search.add_argument("--keyword", action="store_true", help="Exact keyword match only, no embedding model")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        embedded = build_index(args.captions_file, args.index_dir)
+        print(f"Index written to {args.index_dir} ({embedded} new or changed captions embedded)")
+    else:
+        index = CaptionIndex(args.index_dir)
+        if not args.keyword:
+            # Load the model before timing, so the time shown is the search itself
+            index.encoder = CaptionEncoder()
+        start = time.perf_counter()
+        results = index.keyword_search(args.query, args.k) if args.keyword else index.search(args.query, args.k)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for result in results:
+            print(f"{result['score']:.3f}  {result['path']}: {result['caption']}")
+        print(f"{len(results)} results from {len(index.entries)} images in {elapsed_ms:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Export the Blip models to ONNX for ONNX Runtime CPU inference.
+
+Usage:
+    python export_onnx.py [--output-dir onnx_models] [--models blip resnet] [--quantize]
+
+Exports:
+    resnet18.onnx: ResNet-18 classifier (pixel_values -> logits)
+    blip_vision.onnx: BLIP vision encoder (pixel_values -> image_embeds)
+    blip_decoder.onnx: BLIP text decoder for the first step
+        (input_ids, image_embeds -> logits, present key/values)
+    blip_decoder_with_past.onnx: BLIP text decoder for later steps, reusing
+        the self-attention key/value cache of the previous steps
+    blip/: BLIP processor files and the token ids the runtime needs
+
+With --quantize every model is also written as an int8 dynamically
+quantized copy (*.int8.onnx). Requires the optional onnx and onnxruntime
+packages: pip install onnx onnxruntime
+"""
+import argparse
+import json
+import os
+from typing import List, Tuple
+
+import torch
+from torchvision.models import ResNet18_Weights, resnet18
+from transformers import BlipForConditionalGeneration, BlipProcessor
+
+MODEL_NAME = "Salesforce/blip-image-captioning-base"
+ONNX_DIR = "onnx_models"
+OPSET = 17
+BLIP_IMAGE_SIZE = 384
+
+
+def cache_from_flat(flat: Tuple[torch.Tensor, ...]):
+    """
+    Build a transformers key/value cache from a flat (key, value, ...) tuple.
+
+    Args:
+        flat: Self-attention keys and values of every layer, in layer order.
+
+    Returns:
+        DynamicCache: The cache the text decoder expects as past_key_values.
+    """
+    from transformers.cache_utils import DynamicCache
+    cache = DynamicCache()
+    for layer, index in enumerate(range(0, len(flat), 2)):
+        cache.update(flat[index], flat[index + 1], layer)
+    return cache
+
+
+def flatten_cache(cache) -> List[torch.Tensor]:
+    """
+    Flatten a transformers key/value cache to (key, value, ...) tensors.
+
+    Args:
+        cache: A legacy tuple cache or a transformers Cache object.
+
+    Returns:
+        List[torch.Tensor]: The keys and values of every layer, in layer order.
+    """
+    if isinstance(cache, (tuple, list)):
+        return [tensor for layer in cache for tensor in layer[:2]]
+    if hasattr(cache, "layers"):
+        return [tensor for layer in cache.layers for tensor in (layer.keys, layer.values)]
+    return [tensor for layer in cache.to_legacy_cache() for tensor in layer[:2]]
+
+
+class VisionEncoder(torch.nn.Module):
+    """BLIP vision model returning only the image embeddings."""
+
+    def __init__(self, model: BlipForConditionalGeneration):
+        super().__init__()
+        self.vision_model = model.vision_model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.vision_model(pixel_values=pixel_values, return_dict=True).last_hidden_state
+
+
+class TextDecoder(torch.nn.Module):
+    """BLIP text decoder with the key/value cache as flat inputs and outputs."""
+
+    def __init__(self, model: BlipForConditionalGeneration):
+        super().__init__()
+        self.text_decoder = model.text_decoder
+
+    def forward(self, input_ids: torch.Tensor, image_embeds: torch.Tensor, *past: torch.Tensor):
+        outputs = self.text_decoder(
+            input_ids=input_ids,
+            encoder_hidden_states=image_embeds,
+            past_key_values=cache_from_flat(past) if past else None,
+            use_cache=True,
+            return_dict=True
+        )
+        return (outputs.logits, *flatten_cache(outputs.past_key_values))
+
+
+def export_resnet(output_dir: str) -> List[str]:
+    """
+    Export the ResNet-18 classifier used by ImageClassification.py.
+
+    Args:
+        output_dir: Directory to write the model to.
+
+    Returns:
+        List[str]: Paths of the exported files.
+    """
+    model = resnet18(weights=ResNet18_Weights.IMAGENET1K_V1).eval()
+    path = os.path.join(output_dir, "resnet18.onnx")
+    torch.onnx.export(
+        model,
+        (torch.randn(1, 3, 224, 224),),
+        path,
+        input_names=["pixel_values"],
+        output_names=["logits"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=OPSET,
+        dynamo=False
+    )
+    return [path]
+
+
+def export_blip(output_dir: str) -> List[str]:
+    """
+    Export the BLIP vision encoder and the text decoder with key/value cache.
+
+    Args:
+        output_dir: Directory to write the models and processor files to.
+
+    Returns:
+        List[str]: Paths of the exported ONNX files.
+    """
+    processor = BlipProcessor.from_pretrained(MODEL_NAME)
+    model = BlipForConditionalGeneration.from_pretrained(MODEL_NAME).eval()
+    config = model.config.text_config
+
+    blip_dir = os.path.join(output_dir, "blip")
+    processor.save_pretrained(blip_dir)
+    with open(os.path.join(blip_dir, "generation.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "bos_token_id": model.decoder_input_ids,
+            "eos_token_id": config.sep_token_id,
+            "pad_token_id": model.decoder_pad_token_id,
+            "num_layers": config.num_hidden_layers
+        }, f, indent=1)
+
+    vision_path = os.path.join(output_dir, "blip_vision.onnx")
+    pixel_values = torch.randn(1, 3, BLIP_IMAGE_SIZE, BLIP_IMAGE_SIZE)
+    with torch.inference_mode():
+        torch.onnx.export(
+            VisionEncoder(model),
+            (pixel_values,),
+            vision_path,
+            input_names=["pixel_values"],
+            output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=OPSET,
+            dynamo=False
+        )
+        image_embeds = VisionEncoder(model)(pixel_values)
+
+    decoder = TextDecoder(model)
+    present_names = []
+    past_names = []
+    for layer in range(config.num_hidden_layers):
+        for kind in ("key", "value"):
+            present_names.append(f"present.{layer}.{kind}")
+            past_names.append(f"past.{layer}.{kind}")
+    kv_axes = {0: "batch", 2: "sequence"}
+
+    input_ids = torch.full((1, 2), model.decoder_input_ids, dtype=torch.long)
+    decoder_path = os.path.join(output_dir, "blip_decoder.onnx")
+    with torch.inference_mode():
+        torch.onnx.export(
+            decoder,
+            (input_ids, image_embeds),
+            decoder_path,
+            input_names=["input_ids", "image_embeds"],
+            output_names=["logits", *present_names],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "image_embeds": {0: "batch"},
+                "logits": {0: "batch", 1: "sequence"},
+                **{name: kv_axes for name in present_names}
+            },
+            opset_version=OPSET,
+            dynamo=False
+        )
+        past = decoder(input_ids, image_embeds)[1:]
+
+    next_ids = torch.full((1, 1), model.decoder_input_ids, dtype=torch.long)
+    with_past_path = os.path.join(output_dir, "blip_decoder_with_past.onnx")
+    with torch.inference_mode():
+        torch.onnx.export(
+            decoder,
+            (next_ids, image_embeds, *past),
+            with_past_path,
+            input_names=["input_ids", "image_embeds", *past_names],
+            output_names=["logits", *present_names],
+            dynamic_axes={
+                "input_ids": {0: "batch"},
+                "image_embeds": {0: "batch"},
+                "logits": {0: "batch"},
+                **{name: kv_axes for name in past_names + present_names}
+            },
+            opset_version=OPSET,
+            dynamo=False
+        )
+    return [vision_path, decoder_path, with_past_path]
+
+
+def quantize(paths: List[str]) -> List[str]:
+    """
+    Write int8 dynamically quantized copies of ONNX models.
+
+    Args:
+        paths: Paths of the fp32 ONNX models.
+
+    Returns:
+        List[str]: Paths of the quantized models (*.int8.onnx).
+    """
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        raise ImportError("Quantization requires onnxruntime: pip install onnxruntime") from e
+
+    quantized = []
+    for path in paths:
+        output_path = path.replace(".onnx", ".int8.onnx")
+        quantize_dynamic(path, output_path, weight_type=QuantType.QInt8)
+        quantized.append(output_path)
+    return quantized
+
+
+def main() -> None:
+    """Parse the command line and export the selected models."""
+    parser = argparse.ArgumentParser(description="Export the Blip models to ONNX")
+    parser.add_argument("--output-dir", default=ONNX_DIR)
+    parser.add_argument("--models", nargs="+", choices=["blip", "resnet"], default=["blip", "resnet"])
+    parser.add_argument("--quantize", action="store_true", help="Also write int8 quantized models")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    paths = []
+    if "resnet" in args.models:
+        paths += export_resnet(args.output_dir)
+    if "blip" in args.models:
+        paths += export_blip(args.output_dir)
+    if args.quantize:
+        paths += quantize(paths)
+
+    for path in paths:
+        print(f"{path}: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Shared, memory-bounded image loading for the Blip scripts.
+
+The models only see small inputs (384x384 for BLIP, a 224 crop of a 256
+resize for ResNet-18), so decoding a 24 megapixel camera JPEG at full
+resolution wastes most of the decode time and memory. load_image lets the
+JPEG decoder scale down while decoding (draft mode, 1/2, 1/4 or 1/8) to the
+smallest scale that still covers the model input, applies the EXIF
+orientation and caps the pixel count of other formats.
+
+Constants:
+    BLIP_INPUT_SIZE: Shorter side the BLIP processor resizes to
+    RESNET_INPUT_SIZE: Shorter side the ResNet-18 preprocessing resizes to
+    MAX_PIXELS: Largest image kept in memory after decoding
+"""
+from typing import BinaryIO, Union
+
+from PIL import Image, ImageOps
+
+BLIP_INPUT_SIZE = 384
+RESNET_INPUT_SIZE = 256
+MAX_PIXELS = 4096 * 4096
+
+
+def load_image(
+    source: Union[str, BinaryIO, Image.Image],
+    min_size: int = BLIP_INPUT_SIZE,
+    max_pixels: int = MAX_PIXELS
+) -> Image.Image:
+    """
+    Open an image as an upright RGB image no larger than needed.
+
+    Args:
+        source: File path, binary file object or an already opened image.
+        min_size: Both sides are kept at least this large (when the image
+            is), so the model's own resize still downsamples.
+        max_pixels: Images with more pixels are downscaled to fit.
+
+    Returns:
+        Image.Image: The decoded RGB image.
+    """
+    image = source if isinstance(source, Image.Image) else Image.open(source)
+
+    # For JPEGs this picks the largest DCT scale factor that keeps both
+    # sides >= min_size; the skipped detail is never decoded. Other formats
+    # and images that are already loaded ignore it.
+    image.draft("RGB", (min_size, min_size))
+
+    image = ImageOps.exif_transpose(image)
+
+    if image.width * image.height > max_pixels:
+        scale = (max_pixels / (image.width * image.height)) ** 0.5
+        size = (max(min_size, int(image.width * scale)), max(min_size, int(image.height * scale)))
+        image.thumbnail(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    return image.convert("RGB")
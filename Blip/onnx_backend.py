@@ -0,0 +1,191 @@
+"""
+ONNX Runtime backends for the Blip scripts.
+
+The classes here are drop-in replacements for the eager PyTorch models: they
+take and return torch tensors, so the scripts keep using their processors,
+batch_decode and softmax/topk code unchanged. Export the models first with
+export_onnx.py.
+
+Backends:
+    torch: eager fp32 PyTorch (the default)
+    onnx: the exported fp32 ONNX models
+    onnx-int8: the exported int8 dynamically quantized ONNX models
+"""
+import json
+import os
+from typing import List, Optional
+
+import numpy as np
+import torch
+
+ONNX_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+
+def create_session(path: str, threads: Optional[int] = None):
+    """
+    Open an ONNX Runtime CPU inference session.
+
+    Args:
+        path: Path of the ONNX model.
+        threads: Intra-op threads, or None for ONNX Runtime's default.
+
+    Returns:
+        onnxruntime.InferenceSession: The session.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("The onnx backends require onnxruntime: pip install onnxruntime") from e
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found, export the models first with: python export_onnx.py")
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def model_path(model_dir: str, name: str, backend: str) -> str:
+    """
+    Path of an exported model for a backend.
+
+    Args:
+        model_dir: Directory the models were exported to.
+        name: Model name without extension, e.g. "resnet18".
+        backend: "onnx" or "onnx-int8".
+
+    Returns:
+        str: The path of the fp32 or int8 model file.
+    """
+    suffix = ".int8.onnx" if backend == "onnx-int8" else ".onnx"
+    return os.path.join(model_dir, name + suffix)
+
+
+class OnnxResNet:
+    """ResNet-18 classifier on ONNX Runtime, called like the torch model."""
+
+    def __init__(self, backend: str = "onnx", model_dir: str = ONNX_DIR, threads: Optional[int] = None):
+        self.session = create_session(model_path(model_dir, "resnet18", backend), threads)
+
+    def eval(self) -> "OnnxResNet":
+        return self
+
+    def __call__(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        logits, = self.session.run(None, {"pixel_values": pixel_values.numpy()})
+        return torch.from_numpy(logits)
+
+
+class OnnxBlipCaptioner:
+    """
+    BLIP captioning on ONNX Runtime with a generate() like the torch model.
+
+    Decoding is greedy, like the default BlipForConditionalGeneration
+    generate call: the vision encoder runs once, the first decoder step
+    processes the prompt and every later step feeds one token together with
+    the key/value cache of the previous steps.
+    """
+
+    def __init__(self, backend: str = "onnx", model_dir: str = ONNX_DIR, threads: Optional[int] = None):
+        self.vision = create_session(model_path(model_dir, "blip_vision", backend), threads)
+        self.decoder = create_session(model_path(model_dir, "blip_decoder", backend), threads)
+        self.decoder_with_past = create_session(model_path(model_dir, "blip_decoder_with_past", backend), threads)
+        with open(os.path.join(model_dir, "blip", "generation.json"), encoding="utf-8") as f:
+            generation = json.load(f)
+        self.bos_token_id = generation["bos_token_id"]
+        self.eos_token_id = generation["eos_token_id"]
+        self.pad_token_id = generation["pad_token_id"]
+        self.past_names = [
+            f"past.{layer}.{kind}"
+            for layer in range(generation["num_layers"])
+            for kind in ("key", "value")
+        ]
+
+    def eval(self) -> "OnnxBlipCaptioner":
+        return self
+
+    def generate(
+        self,
+        pixel_values: torch.Tensor,
+        input_ids: Optional[torch.Tensor] = None,
+        max_new_tokens: Optional[int] = None,
+        max_length: int = 20,
+        **kwargs
+    ) -> torch.Tensor:
+        """
+        Generate caption token ids for a batch of images.
+
+        Args:
+            pixel_values: Preprocessed images from the BLIP processor.
+            input_ids: Optional text prompt from the BLIP processor; all
+                prompts in a batch must have the same length.
+            max_new_tokens: Maximum number of generated tokens.
+            max_length: Maximum total length when max_new_tokens is not set.
+            **kwargs: Other generate arguments (e.g. attention_mask), ignored.
+
+        Returns:
+            torch.Tensor: Token ids including the prompt, for batch_decode.
+        """
+        image_embeds, = self.vision.run(None, {"pixel_values": pixel_values.numpy()})
+        batch_size = image_embeds.shape[0]
+
+        # Like BLIP's generate: the prompt starts with the decoder BOS token
+        # instead of [CLS] and its trailing [SEP] is dropped
+        if input_ids is None:
+            ids = np.full((batch_size, 1), self.bos_token_id, dtype=np.int64)
+        else:
+            ids = input_ids.numpy().astype(np.int64)[:, :-1].copy()
+            ids[:, 0] = self.bos_token_id
+        if max_new_tokens is None:
+            max_new_tokens = max(1, max_length - ids.shape[1])
+
+        outputs = self.decoder.run(None, {"input_ids": ids, "image_embeds": image_embeds})
+        tokens: List[np.ndarray] = [ids]
+        finished = np.zeros(batch_size, dtype=bool)
+        for step in range(max_new_tokens):
+            logits, past = outputs[0], outputs[1:]
+            next_ids = logits[:, -1].argmax(axis=-1)
+            next_ids = np.where(finished, self.pad_token_id, next_ids)
+            tokens.append(next_ids[:, None])
+            finished |= next_ids == self.eos_token_id
+            if finished.all() or step == max_new_tokens - 1:
+                break
+            feeds = {"input_ids": next_ids[:, None].astype(np.int64), "image_embeds": image_embeds}
+            feeds.update(zip(self.past_names, past))
+            outputs = self.decoder_with_past.run(None, feeds)
+        return torch.from_numpy(np.concatenate(tokens, axis=1))
+
+
+def load_resnet(backend: str = "torch"):
+    """
+    Load the ResNet-18 classifier for a backend.
+
+    Args:
+        backend: One of BACKENDS.
+
+    Returns:
+        The eager torchvision model or an OnnxResNet, both in eval mode.
+    """
+    if backend == "torch":
+        from torchvision.models import ResNet18_Weights, resnet18
+        return resnet18(weights=ResNet18_Weights.IMAGENET1K_V1).eval()
+    return OnnxResNet(backend)
+
+
+def load_blip(model_name: str, backend: str = "torch"):
+    """
+    Load the BLIP captioning model for a backend.
+
+    Args:
+        model_name: HuggingFace model name of the torch model.
+        backend: One of BACKENDS.
+
+    Returns:
+        The BlipForConditionalGeneration model or an OnnxBlipCaptioner, both
+        in eval mode and with a compatible generate().
+    """
+    if backend == "torch":
+        from transformers import BlipForConditionalGeneration
+        return BlipForConditionalGeneration.from_pretrained(model_name).eval()
+    return OnnxBlipCaptioner(backend)
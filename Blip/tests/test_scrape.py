@@ -0,0 +1,187 @@
+"""
+Tests for ScrapeImages2Caption.py against a local HTTP server.
+
+The server serves an HTML page and fixture images with ETags, and the BLIP
+model is replaced by a stub that captions an image with its size, so no
+model is downloaded.
+"""
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("bs4")
+pytest.importorskip("requests")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+from PIL import Image  # noqa: E402
+
+import ScrapeImages2Caption as scraper  # noqa: E402
+
+# Distinct sizes, so the stub caption identifies the image
+LARGE_JPEG_SIZE = (40, 30)
+LARGE_PNG_SIZE = (32, 24)
+OTHER_JPEG_SIZE = (24, 20)
+TINY_SIZE = (5, 5)
+
+
+def encode_image(size: tuple, image_format: str, color: str = "red") -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class FixtureServer:
+    """Serves path -> (content type, body) with ETags and records every request."""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append((self.path, self.headers.get("If-None-Match")))
+                    entry = server.files.get(self.path)
+                if entry is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                content_type, body = entry
+                etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def page(self, path: str, image_paths: list) -> str:
+        images = "".join(f'<img src="{image_path}">' for image_path in image_paths)
+        self.files[path] = ("text/html", f"<html><body>{images}</body></html>".encode())
+        return self.base_url + path
+
+    def responses_for(self, path: str) -> list:
+        with self._lock:
+            return [etag for request_path, etag in self.requests if request_path == path]
+
+
+@pytest.fixture
+def server():
+    fixture = FixtureServer()
+    fixture.files.update({
+        "/large.jpg": ("image/jpeg", encode_image(LARGE_JPEG_SIZE, "JPEG")),
+        "/copy.jpg": ("image/jpeg", encode_image(LARGE_JPEG_SIZE, "JPEG")),
+        "/large.png": ("image/png", encode_image(LARGE_PNG_SIZE, "PNG", "blue")),
+        "/other.jpg": ("image/jpeg", encode_image(OTHER_JPEG_SIZE, "JPEG", "green")),
+        "/tiny.png": ("image/png", encode_image(TINY_SIZE, "PNG")),
+        "/logo.svg": ("image/svg+xml", b'<svg xmlns="http://www.w3.org/2000/svg"/>'),
+        "/notes.jpg": ("text/html", b"<html>not an image</html>"),
+    })
+    fixture.thread.start()
+    yield fixture
+    fixture.httpd.shutdown()
+    fixture.httpd.server_close()
+
+
+@pytest.fixture
+def captioned(monkeypatch):
+    """Replace the BLIP model with a stub; returns the list of captioned image sizes."""
+    sizes = []
+
+    def caption_batch(images, processor, model):
+        sizes.extend(image.size for image in images)
+        return [f"{image.size[0]}x{image.size[1]}" for image in images]
+
+    monkeypatch.setattr(scraper, "load_model", lambda backend="torch": (None, None))
+    monkeypatch.setattr(scraper, "caption_batch", caption_batch)
+    return sizes
+
+
+def run(page_url: str, tmp_path, **kwargs) -> list:
+    output_file = tmp_path / "captions.txt"
+    cache_file = tmp_path / "cache.json"
+    # A lost result would make the in-order writer wait forever; fail instead
+    worker = threading.Thread(
+        target=scraper.scrape_and_caption,
+        args=(page_url, str(output_file)),
+        kwargs=dict(cache_file=str(cache_file), **kwargs),
+        daemon=True
+    )
+    worker.start()
+    worker.join(timeout=60)
+    assert not worker.is_alive(), "scrape_and_caption did not finish"
+    return output_file.read_text(encoding="utf-8").splitlines()
+
+
+def test_skips_small_svg_and_non_images(server, captioned, tmp_path):
+    page_url = server.page("/index.html", ["/large.jpg", "/logo.svg", "/tiny.png", "/notes.jpg", "/large.png"])
+
+    lines = run(page_url, tmp_path)
+
+    assert lines == [
+        f"{server.base_url}/large.jpg: 40x30",
+        f"{server.base_url}/large.png: 32x24",
+    ]
+    assert sorted(captioned) == sorted([LARGE_JPEG_SIZE, LARGE_PNG_SIZE])
+    assert server.responses_for("/logo.svg") == []
+
+
+def test_unchanged_images_reuse_cached_caption(server, captioned, tmp_path):
+    page_url = server.page("/index.html", ["/large.jpg", "/large.png"])
+
+    first = run(page_url, tmp_path)
+    captioned.clear()
+    second = run(page_url, tmp_path)
+
+    assert second == first
+    assert captioned == []
+    # The second crawl sent the cached ETags (and got 304 Not Modified)
+    assert all(server.responses_for(path)[-1] for path in ("/large.jpg", "/large.png"))
+
+
+def test_identical_content_is_captioned_once(server, captioned, tmp_path):
+    run(server.page("/first.html", ["/large.jpg"]), tmp_path)
+    captioned.clear()
+
+    lines = run(server.page("/second.html", ["/copy.jpg"]), tmp_path)
+
+    assert lines == [f"{server.base_url}/copy.jpg: 40x30"]
+    assert captioned == []
+
+
+def test_order_is_kept_when_fetches_fail(server, captioned, tmp_path, monkeypatch):
+    load_image = scraper.load_image
+
+    def failing_load_image(image, min_size):
+        if image.size == LARGE_PNG_SIZE:
+            raise ValueError("unsupported image")
+        return load_image(image, min_size)
+
+    monkeypatch.setattr(scraper, "load_image", failing_load_image)
+    page_url = server.page("/index.html", ["/large.jpg", "/missing.jpg", "/large.png", "/other.jpg"])
+
+    lines = run(page_url, tmp_path, workers=4, batch_size=1)
+
+    assert lines == [
+        f"{server.base_url}/large.jpg: 40x30",
+        f"{server.base_url}/other.jpg: 24x20",
+    ]
@@ -1,83 +1,115 @@
 import gradio as gr
 from transcriber import Transcriber
 from summarizer import Summarizer
-from utils import validate_audio_file, format_transcription_info, save_to_file, get_safe_filename
+from pipeline import MeetingJob, transcribe_meeting, summarize_meeting_stream
+from archive import MeetingArchive
+from utils import validate_audio_file, format_transcription_info, format_transcription_progress, format_timestamp, save_to_file, get_safe_filename
 from config import Config
 import os
+import time
 
 
 class MeetingAssistantApp:
     def __init__(self):
+        # Shared by all sessions: one Whisper process pool and one bounded
+        # Ollama thread pool. Per-session results live in a MeetingJob held
+        # in gr.State, never on this object.
         self.transcriber = Transcriber()
         self.summarizer = Summarizer()
-        self.current_transcription = ""
-        self.current_summary = ""
-        self.current_filename = ""
+        self.archive = MeetingArchive() if Config.ARCHIVE_ENABLED else None
     
-    def process_audio(
+    def transcribe(
         self,
         audio_file,
-        summary_length
+        summary_length,
+        progress=gr.Progress()
     ):
         if audio_file is None:
-            yield "", "", "Please upload an audio file."
+            yield "", "", "Please upload an audio file.", None
             return
         
         audio_path = audio_file if isinstance(audio_file, str) else audio_file.name
-        self.current_filename = os.path.basename(audio_path)
+        filename = os.path.basename(audio_path)
         
         is_valid, error_msg = validate_audio_file(audio_path)
         if not is_valid:
-            yield "", "", error_msg
+            yield "", "", error_msg, None
             return
         
+        job = MeetingJob(self.summarizer, audio_path, summary_length)
         try:
-            status = f"Processing: {self.current_filename}\n"
-            yield status, "", ""
+            status = f"Processing: {filename}\n"
+            yield "", "", status, None
             
-            transcription_result = self.transcriber.transcribe_sync(
-                audio_path,
-                progress=lambda p, desc: self._update_progress(p, desc)
-            )
+            for transcription_result in transcribe_meeting(self.transcriber, job, progress=progress):
+                status = f"Transcribing: {filename} ({transcription_result['progress'] * 100:.0f}%)\n"
+                yield format_transcription_progress(transcription_result), "", status, None
             
-            self.current_transcription = transcription_result.get("text", "")
+            cached_note = " (from cache)" if job.transcription.get("cached") else ""
+            status = f"Transcription complete{cached_note}!\nWaiting for the summarizer...\n"
+            yield format_transcription_info(job.transcription), "", status, job
             
-            transcription_output = format_transcription_info(transcription_result)
-            
-            status = f"Transcription complete!\nGenerating summary...\n"
-            yield transcription_output, "", status
+        except Exception as e:
+            error_status = f"Error processing audio: {str(e)}"
+            yield "", "", error_status, None
+    
+    def summarize(self, job, progress=gr.Progress()):
+        if job is None or not job.transcribed:
+            yield gr.update(), gr.update(), job
+            return
+        
+        try:
+            progress(0.0, desc="Generating summary...")
+            # The summary box fills in as Ollama generates the text. Errors are
+            # raised, so an error message is never archived as the summary
+            for summary in summarize_meeting_stream(self.summarizer, job, progress=progress, raise_errors=True):
+                yield f"MEETING SUMMARY\n{'=' * 50}\n\n{summary}", "Generating summary...", job
             
-            self.current_summary = self.summarizer.summarize(
-                self.current_transcription,
-                summary_length,
-                progress=lambda p, desc: self._update_progress(p, desc)
-            )
+            if self.archive:
+                self.archive.add_meeting(job.filename, job.transcription, job.summary)
             
-            summary_output = f"MEETING SUMMARY\n{'=' * 50}\n\n{self.current_summary}"
+            summary_output = f"MEETING SUMMARY\n{'=' * 50}\n\n{job.summary}"
             
-            status = f"Processing complete!\n\nTranscription and summary generated for: {self.current_filename}"
+            status = f"Processing complete!\n\nTranscription and summary generated for: {job.filename}"
             
-            yield transcription_output, summary_output, status
+            yield summary_output, status, job
             
         except Exception as e:
-            error_status = f"Error processing audio: {str(e)}"
-            yield "", "", error_status
+            # Drop the partial summary, so it is not offered for download
+            job.summary = ""
+            error_status = f"Error generating summary: {str(e)}"
+            yield "", error_status, job
     
-    def _update_progress(self, progress: float, description: str):
-        return (progress, description)
+    def search(self, query):
+        if not self.archive:
+            return "The meeting archive is disabled (ARCHIVE_ENABLED).", []
+        if not query or not query.strip():
+            return "Enter words to search for.", []
+        
+        start = time.perf_counter()
+        matches = self.archive.search(query)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        rows = [
+            [match["filename"], format_timestamp(match["start"]), format_timestamp(match["end"]), match["text"]]
+            for match in matches
+        ]
+        status = f"{len(matches)} matching segments in {self.archive.count()} meetings ({elapsed_ms:.0f} ms)"
+        return status, rows
     
-    def download_transcription(self):
-        if not self.current_transcription:
+    def download_transcription(self, job):
+        if job is None or not job.transcription.get("text"):
             return None
-        filename = get_safe_filename(self.current_filename, "transcription")
-        filepath = save_to_file(self.current_transcription, filename)
+        # Each job writes to its own directory so sessions with the same file name do not collide
+        filename = get_safe_filename(job.filename, "transcription")
+        filepath = save_to_file(job.transcription["text"], filename, os.path.join("outputs", job.id))
         return filepath
     
-    def download_summary(self):
-        if not self.current_summary:
+    def download_summary(self, job):
+        if job is None or not job.summary:
             return None
-        filename = get_safe_filename(self.current_filename, "summary")
-        filepath = save_to_file(self.current_summary, filename)
+        filename = get_safe_filename(job.filename, "summary")
+        filepath = save_to_file(job.summary, filename, os.path.join("outputs", job.id))
         return filepath
 
 
@@ -88,70 +120,99 @@ def create_interface():
         gr.Markdown("# 🎙️ Meeting Assistant")
         gr.Markdown("Upload an audio recording of a meeting to transcribe and summarize it.")
         
-        with gr.Row():
-            with gr.Column(scale=1):
-                audio_input = gr.Audio(
-                    label="Upload Meeting Audio",
-                    type="filepath",
-                    sources=["upload", "microphone"]
-                )
+        job_state = gr.State(None)
+        
+        with gr.Tabs():
+            with gr.Tab("Process Meeting"):
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        audio_input = gr.Audio(
+                            label="Upload Meeting Audio",
+                            type="filepath",
+                            sources=["upload", "microphone"]
+                        )
                 
-                summary_length = gr.Radio(
-                    choices=["brief", "detailed", "very_brief"],
-                    value="brief",
-                    label="Summary Length",
-                    info="Choose how detailed the summary should be"
-                )
+                        summary_length = gr.Radio(
+                            choices=["brief", "detailed", "very_brief"],
+                            value="brief",
+                            label="Summary Length",
+                            info="Choose how detailed the summary should be"
+                        )
                 
-                process_btn = gr.Button(
-                    "Transcribe and Summarize",
-                    variant="primary",
-                    size="lg"
-                )
+                        process_btn = gr.Button(
+                            "Transcribe and Summarize",
+                            variant="primary",
+                            size="lg"
+                        )
             
-            with gr.Column(scale=2):
-                status_box = gr.Textbox(
-                    label="Status",
-                    lines=2,
-                    interactive=False,
-                    placeholder="Upload an audio file to begin..."
-                )
+                    with gr.Column(scale=2):
+                        status_box = gr.Textbox(
+                            label="Status",
+                            lines=2,
+                            interactive=False,
+                            placeholder="Upload an audio file to begin..."
+                        )
         
-        with gr.Row():
-            with gr.Column():
-                transcription_output = gr.Textbox(
-                    label="Transcription",
-                    lines=15,
-                    interactive=False,
-                    placeholder="Transcription will appear here..."
-                )
+                with gr.Row():
+                    with gr.Column():
+                        transcription_output = gr.Textbox(
+                            label="Transcription",
+                            lines=15,
+                            interactive=False,
+                            placeholder="Transcription will appear here..."
+                        )
                 
-                transcript_download_btn = gr.Button(
-                    "⬇️ Download Transcription",
-                    variant="secondary"
-                )
+                        transcript_download_btn = gr.Button(
+                            "⬇️ Download Transcription",
+                            variant="secondary"
+                        )
                 
-                transcript_download = gr.File(
-                    label="",
-                    visible=False
-                )
+                        transcript_download = gr.File(
+                            label="",
+                            visible=False
+                        )
             
-            with gr.Column():
-                summary_output = gr.Textbox(
-                    label="Summary",
-                    lines=15,
-                    interactive=False,
-                    placeholder="Summary will appear here..."
-                )
+                    with gr.Column():
+                        summary_output = gr.Textbox(
+                            label="Summary",
+                            lines=15,
+                            interactive=False,
+                            placeholder="Summary will appear here..."
+                        )
                 
-                summary_download_btn = gr.Button(
-                    "⬇️ Download Summary",
-                    variant="secondary"
-                )
+                        summary_download_btn = gr.Button(
+                            "⬇️ Download Summary",
+                            variant="secondary"
+                        )
+                
+                        summary_download = gr.File(
+                            label="",
+                            visible=False
+                        )
+        
+            with gr.Tab("Search"):
+                gr.Markdown("Search the transcripts of all processed meetings.")
                 
-                summary_download = gr.File(
-                    label="",
-                    visible=False
+                with gr.Row():
+                    search_query = gr.Textbox(
+                        label="Search",
+                        placeholder="Words or phrases said in a meeting...",
+                        scale=4
+                    )
+                    
+                    search_btn = gr.Button(
+                        "🔍 Search",
+                        variant="primary",
+                        scale=1
+                    )
+                
+                search_status = gr.Markdown()
+                
+                search_results = gr.Dataframe(
+                    headers=["Meeting", "Start", "End", "Text"],
+                    datatype=["str", "str", "str", "markdown"],
+                    interactive=False,
+                    wrap=True
                 )
         
         gr.Markdown("---")
@@ -159,17 +220,45 @@ def create_interface():
         gr.Markdown("- ✅ Transcribes audio using Whisper")
         gr.Markdown("- ✅ Summarizes meetings using Ollama (glm-4.7:cloud)")
         gr.Markdown("- ✅ Configurable summary length")
-        gr.Markdown("- ✅ Real-time progress updates")
+        gr.Markdown("- ✅ Real-time progress updates and live transcript")
         gr.Markdown("- ✅ Download transcripts and summaries")
+        gr.Markdown("- ✅ Search all past meetings by what was said and when")
         
+        # Transcription is CPU bound and summarization waits on Ollama, so the
+        # two stages queue separately: a meeting waiting for its summary does
+        # not hold a Whisper slot. Queued users see their position in the
+        # progress overlay of the status box.
         process_btn.click(
-            fn=app.process_audio,
+            fn=app.transcribe,
             inputs=[audio_input, summary_length],
-            outputs=[transcription_output, summary_output, status_box]
+            outputs=[transcription_output, summary_output, status_box, job_state],
+            concurrency_limit=Config.WHISPER_CONCURRENCY,
+            concurrency_id="whisper",
+            show_progress="full"
+        ).then(
+            fn=app.summarize,
+            inputs=[job_state],
+            outputs=[summary_output, status_box, job_state],
+            concurrency_limit=Config.OLLAMA_CONCURRENCY,
+            concurrency_id="ollama",
+            show_progress="full"
+        )
+        
+        search_btn.click(
+            fn=app.search,
+            inputs=[search_query],
+            outputs=[search_status, search_results]
+        )
+        
+        search_query.submit(
+            fn=app.search,
+            inputs=[search_query],
+            outputs=[search_status, search_results]
         )
         
         transcript_download_btn.click(
             fn=app.download_transcription,
+            inputs=[job_state],
             outputs=[transcript_download]
         ).then(
             lambda: gr.update(visible=True),
@@ -178,6 +267,7 @@ def create_interface():
         
         summary_download_btn.click(
             fn=app.download_summary,
+            inputs=[job_state],
             outputs=[summary_download]
         ).then(
             lambda: gr.update(visible=True),
@@ -189,6 +279,10 @@ def create_interface():
 
 if __name__ == "__main__":
     interface = create_interface()
+    interface.queue(
+        max_size=Config.QUEUE_MAX_SIZE,
+        default_concurrency_limit=Config.QUEUE_DEFAULT_CONCURRENCY
+    )
     interface.launch(
         server_name="0.0.0.0",
         server_port=7860,
@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from config import Config
+
+
+class MeetingArchive:
+    # Every processed meeting with its timestamped segments, in SQLite. The
+    # segment text is indexed with FTS5, so a search is an inverted index
+    # lookup instead of a scan over all transcripts.
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or Config.ARCHIVE_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS meetings (
+                    id INTEGER PRIMARY KEY,
+                    audio_hash TEXT UNIQUE,
+                    filename TEXT NOT NULL,
+                    language TEXT,
+                    duration REAL,
+                    summary TEXT,
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY,
+                    meeting_id INTEGER NOT NULL REFERENCES meetings (id) ON DELETE CASCADE,
+                    start REAL NOT NULL,
+                    end REAL NOT NULL,
+                    text TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS segments_meeting ON segments (meeting_id);
+                CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5 (
+                    text, content='segments', content_rowid='id', tokenize='porter unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS segments_ai AFTER INSERT ON segments BEGIN
+                    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+                END;
+                CREATE TRIGGER IF NOT EXISTS segments_ad AFTER DELETE ON segments BEGIN
+                    INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+                END;
+                """
+            )
+
+    def add_meeting(self, filename: str, transcription: Dict[str, Any], summary: str = "") -> int:
+        # A recording that was processed before (same audio hash) replaces its
+        # earlier entry instead of being indexed twice
+        segments = transcription.get("segments") or []
+        if not segments and transcription.get("text"):
+            segments = [{"start": 0.0, "end": transcription.get("duration", 0), "text": transcription["text"]}]
+
+        with self._lock, self._conn:
+            audio_hash = transcription.get("audio_hash")
+            if audio_hash:
+                self._conn.execute("DELETE FROM meetings WHERE audio_hash = ?", (audio_hash,))
+            cursor = self._conn.execute(
+                "INSERT INTO meetings (audio_hash, filename, language, duration, summary, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    audio_hash,
+                    filename,
+                    transcription.get("language"),
+                    transcription.get("duration"),
+                    summary,
+                    time.time()
+                )
+            )
+            meeting_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO segments (meeting_id, start, end, text) VALUES (?, ?, ?, ?)",
+                [
+                    (meeting_id, segment["start"], segment["end"], segment["text"].strip())
+                    for segment in segments
+                    if segment["text"].strip()
+                ]
+            )
+        return meeting_id
+
+    @staticmethod
+    def _match_expression(query: str) -> str:
+        # Every word must occur; words are quoted so user input cannot break
+        # the FTS query syntax, and the last one also matches as a prefix
+        words = [word.replace('"', '""') for word in query.split()]
+        if not words:
+            return ""
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        expression = self._match_expression(query)
+        if not expression:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT m.id, m.filename, m.created, s.start, s.end, "
+                "highlight(segments_fts, 0, '**', '**') "
+                "FROM segments_fts "
+                "JOIN segments s ON s.id = segments_fts.rowid "
+                "JOIN meetings m ON m.id = s.meeting_id "
+                "WHERE segments_fts MATCH ? "
+                "ORDER BY rank LIMIT ?",
+                (expression, limit or Config.ARCHIVE_SEARCH_LIMIT)
+            ).fetchall()
+        return [
+            {
+                "meeting_id": meeting_id,
+                "filename": filename,
+                "created": created,
+                "start": start,
+                "end": end,
+                "text": text
+            }
+            for meeting_id, filename, created, start, end, text in rows
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM meetings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
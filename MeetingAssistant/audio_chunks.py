@@ -0,0 +1,47 @@
+import numpy as np
+from typing import Generator, Iterable, Tuple
+
+
+FRAME_SECONDS = 0.02
+
+
+def _frame_energy(audio: np.ndarray, frame_length: int) -> np.ndarray:
+    usable = len(audio) - len(audio) % frame_length
+    frames = audio[:usable].reshape(-1, frame_length)
+    return np.sqrt(np.mean(frames * frames, axis=1))
+
+
+def find_silence(audio: np.ndarray, sample_rate: int, start: int, end: int) -> int:
+    # Returns the sample index of the quietest frame in audio[start:end]
+    frame_length = int(sample_rate * FRAME_SECONDS)
+    window = audio[start:end]
+    if len(window) < frame_length:
+        return end
+    energy = _frame_energy(window, frame_length)
+    quietest = int(np.argmin(energy))
+    return start + quietest * frame_length + frame_length // 2
+
+
+def iter_chunks(
+    windows: Iterable[np.ndarray],
+    sample_rate: int,
+    chunk_seconds: float,
+    search_seconds: float
+) -> Generator[Tuple[int, np.ndarray], None, None]:
+    # Consumes decoded audio windows and yields (start sample, chunk) pairs of
+    # roughly chunk_seconds, placing each cut at the quietest point of the
+    # search_seconds before the target length so words are not split between
+    # chunks. At most one chunk plus one window is buffered.
+    chunk_length = int(chunk_seconds * sample_rate)
+    search_length = int(search_seconds * sample_rate)
+    buffer = np.zeros(0, dtype=np.float32)
+    start = 0
+    for window in windows:
+        buffer = np.concatenate([buffer, window])
+        while len(buffer) > chunk_length:
+            cut = find_silence(buffer, sample_rate, max(1, chunk_length - search_length), chunk_length)
+            yield start, buffer[:cut]
+            start += cut
+            buffer = buffer[cut:]
+    if len(buffer) or start == 0:
+        yield start, buffer
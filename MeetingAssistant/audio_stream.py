@@ -0,0 +1,87 @@
+import os
+import subprocess
+import tempfile
+import numpy as np
+from typing import Generator, Optional, Tuple
+
+# Bytes of ffmpeg's error output included in a decode error
+STDERR_TAIL_BYTES = 4096
+
+
+def probe_duration(audio_path: str) -> Optional[float]:
+    try:
+        result = subprocess.run(
+            [
+                "ffprobe", "-v", "error",
+                "-show_entries", "format=duration",
+                "-of", "default=noprint_wrappers=1:nokey=1",
+                audio_path
+            ],
+            capture_output=True, text=True, check=True
+        )
+        return float(result.stdout.strip())
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def stream_audio(
+    audio_path: str,
+    sample_rate: int,
+    window_seconds: float
+) -> Generator[np.ndarray, None, None]:
+    # Decodes the file with ffmpeg to mono float32 PCM at sample_rate and
+    # yields it in windows of window_seconds, so only one window is held in
+    # memory at a time whatever the length of the recording.
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-threads", "0",
+        "-i", audio_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate),
+        "-"
+    ]
+    window_bytes = int(window_seconds * sample_rate) * 2
+    # ffmpeg's messages go to a temp file: a damaged recording can log more
+    # than a pipe buffer of decode errors, and ffmpeg would block writing
+    # them while we block reading stdout
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                data = process.stdout.read(window_bytes)
+                if not data:
+                    break
+                data = data[:len(data) - len(data) % 2]
+                yield np.frombuffer(data, np.int16).astype(np.float32) / 32768.0
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            # Only the end of the log, which holds the fatal error
+            stderr_file.seek(max(0, stderr_file.seek(0, os.SEEK_END) - STDERR_TAIL_BYTES))
+            stderr = stderr_file.read().decode(errors="replace")
+            raise RuntimeError(f"Failed to decode audio: {stderr.strip()}")
+
+
+class PcmSpillFile:
+    # Append-only file of float32 samples. Chunks written here can be read
+    # back by worker processes through a memory map instead of being copied
+    # through the process pool's pipes.
+    def __init__(self, directory: Optional[str] = None):
+        fd, self.path = tempfile.mkstemp(suffix=".f32", dir=directory)
+        self._file = os.fdopen(fd, "wb")
+        self._samples = 0
+
+    def append(self, samples: np.ndarray) -> Tuple[int, int]:
+        start = self._samples
+        self._file.write(np.ascontiguousarray(samples, dtype=np.float32).tobytes())
+        self._file.flush()
+        self._samples += len(samples)
+        return start, self._samples
+
+    def close(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def read_spilled(path: str, start: int, end: int) -> np.ndarray:
+    return np.array(np.memmap(path, dtype=np.float32, mode="r")[start:end])
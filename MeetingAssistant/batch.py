@@ -0,0 +1,234 @@
+"""Headless batch transcription and summarization of many recordings.
+
+Usage:
+    python batch.py RECORDINGS_DIR_OR_MANIFEST [--summary-length brief]
+        [--output-dir outputs] [--workers N] [--db batch_jobs.db] [--retry-failed]
+
+The input is either a directory, searched recursively for supported audio
+files, or a manifest file listing one audio path per line (relative paths are
+resolved against the manifest's directory, lines starting with # are
+ignored).
+
+Job state is kept in a SQLite database. Running the same command again after
+an interruption resumes the run: finished recordings are skipped and
+recordings that were being processed are started again.
+"""
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from archive import MeetingArchive
+from config import Config
+from pipeline import process_meeting
+from summarizer import Summarizer
+from transcriber import Transcriber
+from utils import validate_audio_file, save_to_file, get_safe_filename
+
+
+def discover_recordings(source: str) -> List[str]:
+    if os.path.isdir(source):
+        return sorted(
+            str(path) for path in Path(source).rglob("*")
+            if path.is_file() and path.suffix.lower() in Config.SUPPORTED_AUDIO_FORMATS
+        )
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    recordings = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                recordings.append(os.path.normpath(os.path.join(base_dir, line)))
+    return recordings
+
+
+class JobStore:
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "path TEXT PRIMARY KEY, "
+                "status TEXT NOT NULL DEFAULT 'pending', "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "error TEXT, "
+                "transcript_file TEXT, "
+                "summary_file TEXT, "
+                "audio_seconds REAL, "
+                "processing_seconds REAL, "
+                "updated REAL)"
+            )
+
+    def add(self, paths: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO jobs (path, updated) VALUES (?, ?)",
+                [(path, time.time()) for path in paths]
+            )
+
+    def reset_interrupted(self, retry_failed: bool = False):
+        statuses = ("running", "failed") if retry_failed else ("running",)
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET status = 'pending' WHERE status IN ({placeholders})", statuses
+            )
+
+    def pending(self, paths: List[str]) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT path FROM jobs WHERE status = 'pending'").fetchall()
+        pending = {row[0] for row in rows}
+        return [path for path in paths if path in pending]
+
+    def start(self, path: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated = ? WHERE path = ?",
+                (time.time(), path)
+            )
+
+    def finish(self, path: str, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE jobs SET {columns}, updated = ? WHERE path = ?",
+                (*fields.values(), time.time(), path)
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+def output_name(audio_path: str, root: Optional[str]) -> str:
+    # Includes the extension and the sub directories below the input
+    # directory, so meeting.wav and meeting.mp3, or recordings with the same
+    # name in different folders, do not overwrite each other. Manifest entries
+    # can come from anywhere, so they get a short hash of their directory.
+    if root:
+        name = os.path.relpath(audio_path, root)
+    else:
+        directory = os.path.dirname(os.path.abspath(audio_path))
+        name = f"{hashlib.sha1(directory.encode()).hexdigest()[:8]}_{os.path.basename(audio_path)}"
+    return name.replace(os.sep, "_").replace(".", "_")
+
+
+def process_recording(
+    jobs: JobStore,
+    transcriber: Transcriber,
+    summarizer: Summarizer,
+    archive: Optional[MeetingArchive],
+    audio_path: str,
+    name: str,
+    summary_length: str,
+    output_dir: str
+) -> Dict:
+    jobs.start(audio_path)
+    started = time.perf_counter()
+    try:
+        is_valid, error_msg = validate_audio_file(audio_path)
+        if not is_valid:
+            raise ValueError(error_msg)
+
+        for event in process_meeting(transcriber, summarizer, audio_path, summary_length, raise_errors=True):
+            if event["stage"] == "done":
+                transcription = event["transcription"]
+                summary = event["summary"]
+
+        transcript_file = save_to_file(
+            transcription["text"], get_safe_filename(name, "transcription"), output_dir
+        )
+        summary_file = save_to_file(summary, get_safe_filename(name, "summary"), output_dir)
+        if archive:
+            # Archived under the recording's own file name, like web app uploads;
+            # name is only for the output files
+            archive.add_meeting(os.path.basename(audio_path), transcription, summary)
+        stats = {
+            "status": "done",
+            "error": None,
+            "transcript_file": transcript_file,
+            "summary_file": summary_file,
+            "audio_seconds": transcription.get("duration", 0),
+            "processing_seconds": time.perf_counter() - started
+        }
+    except Exception as e:
+        stats = {
+            "status": "failed",
+            "error": str(e),
+            "processing_seconds": time.perf_counter() - started
+        }
+    jobs.finish(audio_path, **stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe and summarize a batch of meeting recordings")
+    parser.add_argument("source", help="Directory of recordings or manifest file with one path per line")
+    parser.add_argument("--summary-length", default=Config.DEFAULT_SUMMARY_LENGTH,
+                        choices=list(Config.SUMMARY_LENGTH_OPTIONS))
+    parser.add_argument("--output-dir", default="outputs")
+    parser.add_argument("--workers", type=int, default=Config.BATCH_WORKERS,
+                        help="Recordings processed at the same time")
+    parser.add_argument("--db", default=Config.BATCH_DB_PATH, help="SQLite file holding the job state")
+    parser.add_argument("--retry-failed", action="store_true", help="Process failed recordings again")
+    args = parser.parse_args()
+
+    recordings = discover_recordings(args.source)
+    root = args.source if os.path.isdir(args.source) else None
+
+    jobs = JobStore(args.db)
+    jobs.add(recordings)
+    jobs.reset_interrupted(args.retry_failed)
+    pending = jobs.pending(recordings)
+    print(f"{len(recordings)} recordings, {len(recordings) - len(pending)} already handled, {len(pending)} to process")
+
+    # Every recording goes through the Whisper process pool, which is shared
+    # by all batch workers; summaries share the Summarizer's Ollama pool.
+    transcriber = Transcriber(parallel_min_seconds=0)
+    summarizer = Summarizer()
+    archive = MeetingArchive() if Config.ARCHIVE_ENABLED else None
+
+    started = time.perf_counter()
+    audio_seconds = 0.0
+    done = failed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = {
+                executor.submit(
+                    process_recording, jobs, transcriber, summarizer, archive, path,
+                    output_name(path, root), args.summary_length, args.output_dir
+                ): path
+                for path in pending
+            }
+            for future in as_completed(futures):
+                stats = future.result()
+                if stats["status"] == "done":
+                    done += 1
+                    audio_seconds += stats["audio_seconds"]
+                    print(f"[{done + failed}/{len(pending)}] done: {futures[future]} "
+                          f"({stats['audio_seconds']:.0f}s audio in {stats['processing_seconds']:.0f}s)")
+                else:
+                    failed += 1
+                    print(f"[{done + failed}/{len(pending)}] failed: {futures[future]}: {stats['error']}")
+    finally:
+        transcriber.close()
+
+    elapsed = time.perf_counter() - started
+    print("-" * 50)
+    print(f"Processed {done} recordings, {failed} failed, in {elapsed / 60:.1f} minutes")
+    if elapsed > 0 and done:
+        print(f"Throughput: {done / elapsed * 3600:.1f} recordings/hour, "
+              f"{audio_seconds / 3600:.1f} hours of audio at {audio_seconds / elapsed:.1f}x real time")
+    print(f"Job totals: {jobs.counts()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Compare Whisper backends on real-time factor, peak memory and word error rate.
+
+Usage:
+    python benchmark_backends.py samples/meeting.wav [more audio files...]
+        [--backends openai openai-int8 faster-whisper] [--model base]
+
+For every audio file a reference transcript with the same name and a .txt
+extension (e.g. samples/meeting.txt) is used to compute the word error rate;
+files without one are reported without WER. Each backend runs in a fresh
+process so its peak memory can be measured on its own.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import re
+import resource
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config import Config
+from audio_stream import stream_audio
+from whisper_backends import BACKENDS, SAMPLE_RATE, load_backend
+
+
+def normalize_words(text: str) -> List[str]:
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    # Levenshtein distance over words, one row at a time
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def _run_backend(backend_name: str, model_name: str, audio_paths: List[str], results) -> None:
+    start = time.perf_counter()
+    backend = load_backend(backend_name, model_name, Config.WHISPER_DEVICE, os.cpu_count())
+    load_seconds = time.perf_counter() - start
+
+    runs = []
+    for audio_path in audio_paths:
+        audio = np.concatenate(list(stream_audio(audio_path, SAMPLE_RATE, Config.DECODE_WINDOW_SECONDS)))
+        start = time.perf_counter()
+        text = backend.transcribe(audio)["text"]
+        runs.append({
+            "audio_path": audio_path,
+            "duration": len(audio) / SAMPLE_RATE,
+            "seconds": time.perf_counter() - start,
+            "text": text
+        })
+    # ru_maxrss is in kilobytes on Linux
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put({"load_seconds": load_seconds, "peak_mb": peak_mb, "runs": runs})
+
+
+def benchmark(backend_name: str, model_name: str, audio_paths: List[str]) -> Optional[Dict]:
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=_run_backend, args=(backend_name, model_name, audio_paths, results))
+    process.start()
+    # Read before joining: a child with a large result blocks until it is consumed
+    result = None
+    while result is None and (process.is_alive() or not results.empty()):
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            pass
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Whisper backends")
+    parser.add_argument("audio", nargs="+", help="Audio files to transcribe")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--model", default=Config.WHISPER_MODEL, help="Whisper model size")
+    args = parser.parse_args()
+
+    references = {}
+    for audio_path in args.audio:
+        reference_path = os.path.splitext(audio_path)[0] + ".txt"
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding="utf-8") as f:
+                references[audio_path] = f.read()
+
+    print(f"{'backend':<16}{'file':<28}{'RTF':>8}{'WER':>8}{'load s':>9}{'peak MB':>9}")
+    for backend_name in args.backends:
+        result = benchmark(backend_name, args.model, args.audio)
+        if result is None:
+            print(f"{backend_name:<16}failed (see error above)")
+            continue
+        for run in result["runs"]:
+            rtf = run["seconds"] / run["duration"] if run["duration"] else 0.0
+            reference = references.get(run["audio_path"])
+            wer = f"{word_error_rate(reference, run['text']):.3f}" if reference is not None else "-"
+            name = os.path.basename(run["audio_path"])[:27]
+            print(f"{backend_name:<16}{name:<28}{rtf:>8.3f}{wer:>8}"
+                  f"{result['load_seconds']:>9.1f}{result['peak_mb']:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+from config import Config
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    # A persistent key/value cache in SQLite. Values are stored as JSON and
+    # the least recently used entries are evicted once the cache grows
+    # beyond max_mb.
+    def __init__(self, name: str, max_mb: float, path: Optional[str] = None):
+        self.name = name
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.path = path or Config.CACHE_PATH
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.name}_accessed ON {self.name} (accessed)"
+            )
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        return "|".join(parts)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.name} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                f"UPDATE {self.name} SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        data = json.dumps(value)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.name} (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time())
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.name}").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            f"SELECT key, size FROM {self.name} ORDER BY accessed"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+            total -= size
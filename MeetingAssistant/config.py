@@ -3,12 +3,66 @@ import os
 class Config:
     WHISPER_MODEL = "base"
     WHISPER_DEVICE = "cpu"
+    # "openai" (openai-whisper, fp32), "openai-int8" (openai-whisper with
+    # dynamically quantized Linear layers) or "faster-whisper" (CTranslate2,
+    # needs the faster-whisper package). Compare them with benchmark_backends.py.
+    WHISPER_BACKEND = "openai"
+    WHISPER_COMPUTE_TYPE = "int8"
+    WHISPER_BATCH_SIZE = 8
+    
+    # Long recordings are split at silences into chunks that are transcribed
+    # in parallel by TRANSCRIBE_WORKERS processes, each with its own model.
+    TRANSCRIBE_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+    PARALLEL_MIN_SECONDS = 600
+    CHUNK_SECONDS = 300
+    CHUNK_SEARCH_SECONDS = 15
+    # Shorter recordings are transcribed chunk by chunk in-process so partial
+    # transcripts can be shown while the rest is still being decoded.
+    STREAM_CHUNK_SECONDS = 30
+    PROMPT_CONTEXT_CHARS = 200
+    
+    # Audio is decoded by ffmpeg as a stream of DECODE_WINDOW_SECONDS windows,
+    # so memory use stays constant however long the recording is. With
+    # AUDIO_SPILL_TO_DISK the parallel chunks are handed to the workers through
+    # a memory-mapped temp file in AUDIO_SPILL_DIR instead of through pipes.
+    DECODE_WINDOW_SECONDS = 30
+    AUDIO_SPILL_TO_DISK = False
+    AUDIO_SPILL_DIR = None
     
     OLLAMA_BASE_URL = "http://localhost:11434"
     OLLAMA_MODEL = "glm-4.7:cloud"
     OLLAMA_TIMEOUT = 300
+    # How long Ollama keeps the model loaded after a request, so the next
+    # meeting does not pay the model load time
+    OLLAMA_KEEP_ALIVE = "30m"
+    
+    # Transcripts are cached by audio content hash and Whisper model, summaries
+    # by transcript hash, Ollama model and summary length.
+    CACHE_ENABLED = True
+    CACHE_PATH = os.path.join("cache", "results.db")
+    TRANSCRIPT_CACHE_MAX_MB = 512
+    SUMMARY_CACHE_MAX_MB = 64
+    
+    # Every processed meeting is stored with its timestamped segments in a
+    # full-text indexed archive, searchable from the Search tab.
+    ARCHIVE_ENABLED = True
+    ARCHIVE_PATH = os.path.join("archive", "meetings.db")
+    ARCHIVE_SEARCH_LIMIT = 50
+    
+    # Web app queue: meetings transcribed at the same time (they share the
+    # TRANSCRIBE_WORKERS pool) and summaries generated at the same time (they
+    # share the SUMMARY_PARALLELISM Ollama calls). Requests beyond
+    # QUEUE_MAX_SIZE waiting users are rejected.
+    WHISPER_CONCURRENCY = 2
+    OLLAMA_CONCURRENCY = 4
+    QUEUE_DEFAULT_CONCURRENCY = 4
+    QUEUE_MAX_SIZE = 32
+    
+    # batch.py: recordings processed at the same time and the job state file
+    BATCH_WORKERS = 2
+    BATCH_DB_PATH = "batch_jobs.db"
     
-    MAX_AUDIO_SIZE_MB = 100
+    MAX_AUDIO_SIZE_MB = 8192
     SUPPORTED_AUDIO_FORMATS = [".wav", ".mp3", ".m4a", ".flac", ".ogg", ".wma"]
     
     SUMMARY_LENGTH_OPTIONS = {
@@ -28,4 +82,39 @@ Focus on:
 - Action items and responsibilities
 
 Meeting Transcription:
-{transcription}"""
\ No newline at end of file
+{transcription}"""    
+    # Transcripts longer than SUMMARY_MAP_THRESHOLD_TOKENS are summarized
+    # map-reduce style: windows of SUMMARY_WINDOW_TOKENS are summarized
+    # concurrently (at most SUMMARY_PARALLELISM Ollama calls at once) and the
+    # partial summaries are then combined into the final summary.
+    SUMMARY_MAP_THRESHOLD_TOKENS = 6000
+    SUMMARY_WINDOW_TOKENS = 3000
+    SUMMARY_PARALLELISM = 4
+    SUMMARY_MAX_REDUCE_ROUNDS = 3
+    # Summarize completed transcript windows while Whisper is still decoding
+    # later audio, leaving only the final reduce step after transcription.
+    PIPELINE_MODE = True
+    
+    MAP_PROMPT_TEMPLATE = """You are a professional meeting assistant. Below is one part of a longer meeting transcription.
+Write concise notes on this part only.
+
+Focus on:
+- Key topics discussed
+- Important decisions made
+- Action items and responsibilities
+
+Transcription part:
+{transcription}"""
+    
+    REDUCE_PROMPT_TEMPLATE = """You are a professional meeting assistant. Below are notes on consecutive parts of one meeting, in order.
+Combine them into a single summary of the whole meeting.
+
+{length_instruction}
+
+Focus on:
+- Key topics discussed
+- Important decisions made
+- Action items and responsibilities
+
+Notes:
+{partial_summaries}"""
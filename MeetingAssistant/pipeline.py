@@ -0,0 +1,97 @@
+import os
+import uuid
+from typing import Any, Callable, Dict, Generator, Optional
+from config import Config
+from transcriber import Transcriber
+from summarizer import Summarizer
+
+
+class MeetingJob:
+    # State of one meeting moving through the pipeline. The web app keeps one
+    # per browser session, so concurrent users never see each other's results.
+    def __init__(self, summarizer: Summarizer, audio_path: str, summary_length: str):
+        self.id = uuid.uuid4().hex
+        self.audio_path = audio_path
+        self.filename = os.path.basename(audio_path)
+        self.summary_length = summary_length
+        self.summary_job = summarizer.start_job(summary_length)
+        self.fed = 0
+        self.transcription: Dict[str, Any] = {}
+        self.summary = ""
+
+    @property
+    def transcribed(self) -> bool:
+        return bool(self.transcription.get("done"))
+
+
+def transcribe_meeting(
+    transcriber: Transcriber,
+    job: MeetingJob,
+    progress: Optional[Callable] = None
+) -> Generator[Dict[str, Any], None, None]:
+    # Yields the partial transcription results; the complete one is stored in
+    # job.transcription. With Config.PIPELINE_MODE the transcript is fed to the
+    # summary job as it is decoded, so partial summaries of early windows are
+    # generated while Whisper is still working on later audio.
+    for result in transcriber.transcribe(job.audio_path, progress=progress):
+        if Config.PIPELINE_MODE and not result.get("cached"):
+            job.summary_job.feed(result["text"][job.fed:])
+            job.fed = len(result["text"])
+        job.transcription = result
+        if not result["done"]:
+            yield result
+
+
+def summarize_meeting_stream(
+    summarizer: Summarizer,
+    job: MeetingJob,
+    progress: Optional[Callable] = None,
+    raise_errors: bool = False
+) -> Generator[str, None, None]:
+    # Yields the summary generated so far; job.summary holds the full summary
+    # at the end. Summarization errors are yielded as the summary text unless
+    # raise_errors is set
+    text = job.transcription.get("text", "")
+    if job.fed:
+        job.summary_job.feed(text[job.fed:])
+        job.fed = len(text)
+        summaries = job.summary_job.stream(progress, raise_errors)
+    else:
+        summaries = summarizer.summarize_stream(text, job.summary_length, progress, raise_errors)
+    for summary in summaries:
+        job.summary = summary
+        yield summary
+
+
+def summarize_meeting(
+    summarizer: Summarizer,
+    job: MeetingJob,
+    progress: Optional[Callable] = None,
+    raise_errors: bool = False
+) -> str:
+    for _ in summarize_meeting_stream(summarizer, job, progress, raise_errors):
+        pass
+    return job.summary
+
+
+def process_meeting(
+    transcriber: Transcriber,
+    summarizer: Summarizer,
+    audio_path: str,
+    summary_length: str,
+    progress: Optional[Callable] = None,
+    raise_errors: bool = False
+) -> Generator[Dict[str, Any], None, None]:
+    # Yields {"stage": "transcribing", "transcription": partial result} while
+    # transcribing, {"stage": "summarizing", ...} once the transcript is
+    # complete and {"stage": "done", "transcription": ..., "summary": ...}
+    # at the end.
+    job = MeetingJob(summarizer, audio_path, summary_length)
+    for result in transcribe_meeting(transcriber, job, progress):
+        yield {"stage": "transcribing", "transcription": result}
+
+    yield {"stage": "summarizing", "transcription": job.transcription}
+
+    summary = summarize_meeting(summarizer, job, progress, raise_errors)
+
+    yield {"stage": "done", "transcription": job.transcription, "summary": summary}
@@ -1,69 +1,254 @@
+import json
 import requests
-from typing import Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Callable, Generator, List, Optional
 from config import Config
+from utils import estimate_tokens, split_into_windows
+from cache import ResultCache, text_hash
 
 
 class Summarizer:
-    def __init__(self, base_url=None, model=None):
+    def __init__(self, base_url=None, model=None, parallelism=None, cache=None):
         self.base_url = base_url or Config.OLLAMA_BASE_URL
         self.model = model or Config.OLLAMA_MODEL
         self.timeout = Config.OLLAMA_TIMEOUT
-    
-    def _call_ollama_api(self, prompt: str) -> str:
-        url = f"{self.base_url}/api/generate"
-        
-        payload = {
+        self.parallelism = parallelism or Config.SUMMARY_PARALLELISM
+        # Shared by all summaries so the number of concurrent Ollama calls stays bounded
+        self._executor = ThreadPoolExecutor(max_workers=self.parallelism)
+        # One pooled session, so Ollama connections are reused across calls;
+        # the pool has room for every map call plus a streaming final call
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=self.parallelism + 1))
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=self.parallelism + 1))
+        if cache is None and Config.CACHE_ENABLED:
+            cache = ResultCache("summaries", Config.SUMMARY_CACHE_MAX_MB)
+        self.cache = cache
+
+    def _payload(self, prompt: str, stream: bool) -> dict:
+        return {
             "model": self.model,
             "prompt": prompt,
-            "stream": False,
+            "stream": stream,
+            # Keeps the model loaded between meetings instead of reloading it
+            "keep_alive": Config.OLLAMA_KEEP_ALIVE,
             "options": {
                 "temperature": 0.7,
                 "num_predict": 2048
             }
         }
-        
-        response = requests.post(url, json=payload, timeout=self.timeout)
+
+    def _call_ollama_api(self, prompt: str) -> str:
+        url = f"{self.base_url}/api/generate"
+
+        response = self.session.post(url, json=self._payload(prompt, stream=False), timeout=self.timeout)
         response.raise_for_status()
-        
+
         result = response.json()
         return result.get("response", "")
-    
-    def summarize(
+
+    def _stream_ollama_api(self, prompt: str) -> Generator[str, None, None]:
+        # Yields the response text as Ollama generates it (newline-delimited
+        # JSON chunks); the timeout applies between chunks, not to the whole reply.
+        # The response is read to its end, past the "done" chunk, so the
+        # connection goes back to the pool instead of being closed
+        url = f"{self.base_url}/api/generate"
+
+        with self.session.post(url, json=self._payload(prompt, stream=True), timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise requests.exceptions.RequestException(chunk["error"])
+                if chunk.get("response"):
+                    yield chunk["response"]
+
+    def _summarize_windows(self, windows: List[str]) -> List[str]:
+        prompts = [Config.MAP_PROMPT_TEMPLATE.format(transcription=window) for window in windows]
+        return list(self._executor.map(self._call_ollama_api, prompts))
+
+    def _reduce_prompt(
         self,
-        transcription: str,
-        summary_length: str = "brief",
+        partial_summaries: List[str],
+        length_instruction: str,
         progress: Optional[Callable] = None
     ) -> str:
-        if not transcription or not transcription.strip():
-            return "No transcription provided to summarize."
-        
+        # Summarize the partial summaries again until they fit in one prompt
+        # (a few rounds at most, in case the model does not condense them)
+        # and return the prompt that combines them into the final summary
+        combined = "\n\n".join(partial_summaries)
+        for _ in range(Config.SUMMARY_MAX_REDUCE_ROUNDS):
+            if len(partial_summaries) == 1 or estimate_tokens(combined) <= Config.SUMMARY_MAP_THRESHOLD_TOKENS:
+                break
+            if progress:
+                progress(0.7, desc=f"Condensing {len(partial_summaries)} partial summaries...")
+            windows = split_into_windows(combined, Config.SUMMARY_WINDOW_TOKENS)
+            partial_summaries = self._summarize_windows(windows)
+            combined = "\n\n".join(partial_summaries)
+
         if progress:
-            progress(0.5, desc="Generating summary with Ollama...")
-        
-        length_instruction = Config.SUMMARY_LENGTH_OPTIONS.get(
-            summary_length,
-            Config.SUMMARY_LENGTH_OPTIONS[Config.DEFAULT_SUMMARY_LENGTH]
+            progress(0.8, desc="Combining partial summaries...")
+
+        numbered = "\n\n".join(
+            f"Part {index}:\n{summary}" for index, summary in enumerate(partial_summaries, start=1)
         )
-        
-        prompt = Config.SUMMARY_PROMPT_TEMPLATE.format(
+        return Config.REDUCE_PROMPT_TEMPLATE.format(
             length_instruction=length_instruction,
-            transcription=transcription
+            partial_summaries=numbered
         )
-        
+
+    def _submit_map(self, window: str):
+        prompt = Config.MAP_PROMPT_TEMPLATE.format(transcription=window)
+        return self._executor.submit(self._call_ollama_api, prompt)
+
+    def _length_instruction(self, summary_length: str) -> str:
+        return Config.SUMMARY_LENGTH_OPTIONS.get(
+            summary_length,
+            Config.SUMMARY_LENGTH_OPTIONS[Config.DEFAULT_SUMMARY_LENGTH]
+        )
+
+    def _cache_key(self, transcription: str, summary_length: str) -> str:
+        return ResultCache.make_key(text_hash(transcription), self.model, summary_length)
+
+    def start_job(self, summary_length: str = "brief") -> "SummaryJob":
+        return SummaryJob(self, summary_length)
+
+    def summarize_stream(
+        self,
+        transcription: str,
+        summary_length: str = "brief",
+        progress: Optional[Callable] = None,
+        raise_errors: bool = False
+    ) -> Generator[str, None, None]:
+        # Yields the summary generated so far, ending with the full summary.
+        # The cache is checked here, before feeding could start summarizing
+        # windows of a long transcript, and the job does not check it again.
+        cache_key = self._cache_key(transcription, summary_length)
+        if self.cache and transcription:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                if progress:
+                    progress(1.0, desc="Loaded summary from cache")
+                yield cached
+                return
+
+        job = self.start_job(summary_length)
+        job.feed(transcription)
+        job.checked_cache_key = cache_key
+        yield from job.stream(progress, raise_errors)
+
+    def summarize(
+        self,
+        transcription: str,
+        summary_length: str = "brief",
+        progress: Optional[Callable] = None,
+        raise_errors: bool = False
+    ) -> str:
+        summary = ""
+        for summary in self.summarize_stream(transcription, summary_length, progress, raise_errors):
+            pass
+        return summary
+
+
+class SummaryJob:
+    # Incremental map-reduce summary. Transcript text can be fed while it is
+    # still being transcribed: once the transcript is long enough to need
+    # map-reduce, every completed window is summarized right away, so when
+    # the transcript is done only the last window and the reduce step remain.
+    def __init__(self, summarizer: Summarizer, summary_length: str):
+        self.summarizer = summarizer
+        self.summary_length = summary_length
+        self._parts: List[str] = []
+        self._pending = ""
+        self._tokens = 0
+        self._partial_futures = []
+        # Cache key of the complete transcript, once the cache was checked for it
+        self.checked_cache_key: Optional[str] = None
+
+    def feed(self, text: str):
+        self._parts.append(text)
+        self._pending += text
+        self._tokens += estimate_tokens(text)
+        if self._tokens > Config.SUMMARY_MAP_THRESHOLD_TOKENS:
+            self._submit_windows(final=False)
+
+    def _submit_windows(self, final: bool):
+        windows = split_into_windows(self._pending, Config.SUMMARY_WINDOW_TOKENS)
+        # The last window may still grow unless the transcript is complete
+        self._pending = "" if final or not windows else windows.pop()
+        for window in windows:
+            self._partial_futures.append(self.summarizer._submit_map(window))
+
+    def stream(self, progress: Optional[Callable] = None, raise_errors: bool = False) -> Generator[str, None, None]:
+        # Yields the summary generated so far while the final Ollama call
+        # streams, ending with the full summary (or an error message)
+        transcription = "".join(self._parts)
+        if not transcription or not transcription.strip():
+            yield "No transcription provided to summarize."
+            return
+
+        summarizer = self.summarizer
+        length_instruction = summarizer._length_instruction(self.summary_length)
+        cache_key = self.checked_cache_key
+        if cache_key is None:
+            cache_key = summarizer._cache_key(transcription, self.summary_length)
+            cached = summarizer.cache.get(cache_key) if summarizer.cache else None
+            if cached is not None:
+                if progress:
+                    progress(1.0, desc="Loaded summary from cache")
+                yield cached
+                return
+
+        summary = ""
         try:
-            summary = self._call_ollama_api(prompt)
-            
+            if not self._partial_futures and self._tokens <= Config.SUMMARY_MAP_THRESHOLD_TOKENS:
+                if progress:
+                    progress(0.5, desc="Generating summary with Ollama...")
+
+                prompt = Config.SUMMARY_PROMPT_TEMPLATE.format(
+                    length_instruction=length_instruction,
+                    transcription=transcription
+                )
+            else:
+                self._submit_windows(final=True)
+
+                if progress:
+                    progress(0.3, desc=f"Summarizing {len(self._partial_futures)} parts of the transcription...")
+
+                partial_summaries = [future.result() for future in self._partial_futures]
+                prompt = summarizer._reduce_prompt(partial_summaries, length_instruction, progress)
+
+            for chunk in summarizer._stream_ollama_api(prompt):
+                summary += chunk
+                yield summary
+
+            if summarizer.cache:
+                summarizer.cache.put(cache_key, summary)
+
             if progress:
                 progress(1.0, desc="Summary generated successfully")
-            
-            return summary
+
+            if not summary:
+                yield summary
         except requests.exceptions.RequestException as e:
+            if raise_errors:
+                raise
             error_msg = f"Error calling Ollama API: {str(e)}"
             if progress:
                 progress(1.0, desc=error_msg)
-            return error_msg
+            yield error_msg
         except Exception as e:
+            if raise_errors:
+                raise
             error_msg = f"Unexpected error during summarization: {str(e)}"
             if progress:
                 progress(1.0, desc=error_msg)
-            return error_msg
\ No newline at end of file
+            yield error_msg
+
+    def finish(self, progress: Optional[Callable] = None, raise_errors: bool = False) -> str:
+        summary = ""
+        for summary in self.stream(progress, raise_errors):
+            pass
+        return summary
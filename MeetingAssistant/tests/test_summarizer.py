@@ -0,0 +1,128 @@
+# Tests the Summarizer's Ollama client against a stub Ollama server that
+# streams newline-delimited JSON from /api/generate.
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from config import Config  # noqa: E402
+from summarizer import Summarizer  # noqa: E402
+
+
+class StubOllama:
+    def __init__(self):
+        self.chunks = []
+        self.payloads = []
+        self.connections = 0
+        # When set, the stream pauses after its first chunk until the event is set
+        self.gate = None
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                stub.connections += 1
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.payloads.append(payload)
+
+                if not payload.get("stream"):
+                    text = "".join(chunk.get("response", "") for chunk in stub.chunks)
+                    body = json.dumps({"response": text, "done": True}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for index, chunk in enumerate(stub.chunks):
+                    line = json.dumps(chunk).encode() + b"\n"
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                    if index == 0 and stub.gate is not None:
+                        stub.gate.wait(timeout=10)
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.gate is not None:
+            self.gate.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubOllama()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def summarizer(stub, monkeypatch):
+    monkeypatch.setattr(Config, "CACHE_ENABLED", False)
+    summarizer = Summarizer(base_url=stub.base_url, model="stub-model", parallelism=2)
+    yield summarizer
+    summarizer.session.close()
+
+
+def test_stream_yields_partial_text(stub, summarizer):
+    stub.chunks = [{"response": "Hello", "done": False}, {"response": " world", "done": False}, {"done": True}]
+    stub.gate = threading.Event()
+
+    chunks = summarizer._stream_ollama_api("prompt")
+    # The server is still holding back the rest of the reply
+    assert next(chunks) == "Hello"
+    stub.gate.set()
+    assert list(chunks) == [" world"]
+
+    stub.gate = None
+    partials = list(summarizer.summarize_stream("Short meeting transcript.", "brief"))
+    assert partials == ["Hello", "Hello world"]
+
+
+def test_error_chunk_is_surfaced(stub, summarizer):
+    stub.chunks = [{"response": "Hel", "done": False}, {"error": "model 'stub-model' not found"}]
+
+    with pytest.raises(requests.exceptions.RequestException, match="not found"):
+        list(summarizer._stream_ollama_api("prompt"))
+
+    summary = summarizer.summarize("Short meeting transcript.", "brief")
+    assert summary == "Error calling Ollama API: model 'stub-model' not found"
+
+    with pytest.raises(requests.exceptions.RequestException):
+        summarizer.summarize("Short meeting transcript.", "brief", raise_errors=True)
+
+
+def test_payload_and_pooled_session(stub, summarizer):
+    stub.chunks = [{"response": "Summary", "done": False}, {"done": True}]
+
+    assert summarizer.summarize("First meeting.", "brief") == "Summary"
+    assert summarizer.summarize("Second meeting.", "detailed") == "Summary"
+    assert summarizer._call_ollama_api("prompt") == "Summary"
+
+    streamed = [payload for payload in stub.payloads if payload["stream"]]
+    assert len(streamed) == 2
+    assert all(payload["keep_alive"] == Config.OLLAMA_KEEP_ALIVE for payload in stub.payloads)
+    assert all(payload["model"] == "stub-model" for payload in stub.payloads)
+    # All three calls went over one kept-alive connection of the session's pool
+    assert stub.connections == 1
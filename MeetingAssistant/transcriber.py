@@ -1,51 +1,234 @@
-import whisper
-from typing import Generator, Dict, Any
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Generator, Dict, Any, Iterable, List, Optional, Tuple
 from config import Config
+from audio_chunks import iter_chunks
+from audio_stream import PcmSpillFile, probe_duration, read_spilled, stream_audio
+from cache import ResultCache, file_hash
+from whisper_backends import SAMPLE_RATE, N_SAMPLES, load_backend
+
+
+# Whisper backend of a chunk worker process, loaded once per process
+_worker_backend = None
+
+
+def _init_worker(backend_name: str, model_name: str, device: str, threads: int):
+    global _worker_backend
+    _worker_backend = load_backend(backend_name, model_name, device, threads)
+
+
+def _detect_language(audio) -> str:
+    return _worker_backend.detect_language(audio)
+
+
+def _transcribe_audio(
+    backend,
+    audio,
+    language: Optional[str],
+    offset: float = 0.0,
+    initial_prompt: Optional[str] = None
+) -> Dict[str, Any]:
+    result = backend.transcribe(audio, language=language, initial_prompt=initial_prompt)
+    result["segments"] = [
+        {
+            "start": segment["start"] + offset,
+            "end": segment["end"] + offset,
+            "text": segment["text"]
+        }
+        for segment in result["segments"]
+    ]
+    return result
+
+
+def _transcribe_chunk(audio, language: str, offset: float) -> Dict[str, Any]:
+    return _transcribe_audio(_worker_backend, audio, language, offset)
+
+
+def _transcribe_spilled_chunk(path: str, start: int, end: int, language: str, offset: float) -> Dict[str, Any]:
+    return _transcribe_audio(_worker_backend, read_spilled(path, start, end), language, offset)
 
 
 class Transcriber:
-    def __init__(self, model_name=None, device=None):
+    def __init__(self, model_name=None, device=None, workers=None, cache=None, backend=None, parallel_min_seconds=None):
         self.model_name = model_name or Config.WHISPER_MODEL
         self.device = device or Config.WHISPER_DEVICE
+        self.backend_name = backend or Config.WHISPER_BACKEND
+        self.workers = workers or Config.TRANSCRIBE_WORKERS
+        self.parallel_min_seconds = (
+            Config.PARALLEL_MIN_SECONDS if parallel_min_seconds is None else parallel_min_seconds
+        )
         self.model = None
-    
+        # The in-process model is shared by every caller of this Transcriber
+        # and is not safe to run from several threads at once
+        self._model_lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        if cache is None and Config.CACHE_ENABLED:
+            cache = ResultCache("transcripts", Config.TRANSCRIPT_CACHE_MAX_MB)
+        self.cache = cache
+
     def load_model(self, progress=None):
+        with self._model_lock:
+            self._load_model(progress)
+
+    def _load_model(self, progress=None):
         if self.model is None:
             if progress:
                 progress(0.1, desc="Loading Whisper model...")
-            self.model = whisper.load_model(self.model_name, device=self.device)
+            self.model = load_backend(self.backend_name, self.model_name, self.device)
             if progress:
                 progress(0.2, desc="Whisper model loaded")
-    
-    def transcribe(self, audio_path: str, progress=None) -> Generator[Dict[str, Any], None, None]:
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                threads = max(1, multiprocessing.cpu_count() // self.workers)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.backend_name, self.model_name, self.device, threads)
+                )
+            return self._pool
+
+    def _transcribe_parallel(
+        self,
+        chunks: Iterable[Tuple[int, Any]],
+        progress=None
+    ) -> Generator[Tuple[Dict[str, Any], int], None, None]:
+        pool = self._get_pool()
+        spill = PcmSpillFile(Config.AUDIO_SPILL_DIR) if Config.AUDIO_SPILL_TO_DISK else None
+        language = None
+        in_flight = deque()
+        try:
+            for start, chunk in chunks:
+                if language is None:
+                    if progress:
+                        progress(0.0, desc="Detecting language...")
+                    # Detect the language once so every chunk is decoded in the same language
+                    language = pool.submit(_detect_language, chunk[:N_SAMPLES]).result()
+
+                offset = start / SAMPLE_RATE
+                if spill:
+                    span = spill.append(chunk)
+                    future = pool.submit(_transcribe_spilled_chunk, spill.path, *span, language, offset)
+                else:
+                    future = pool.submit(_transcribe_chunk, chunk, language, offset)
+                in_flight.append((future, start + len(chunk)))
+
+                # Bound the chunks waiting in the pool so memory does not grow
+                # with the length of the recording; results come out in order
+                while len(in_flight) >= self.workers * 2:
+                    future, end = in_flight.popleft()
+                    yield future.result(), end
+
+            while in_flight:
+                future, end = in_flight.popleft()
+                yield future.result(), end
+        finally:
+            for future, _ in in_flight:
+                future.cancel()
+            if spill:
+                spill.close()
+
+    def _transcribe_sequential(
+        self,
+        chunks: Iterable[Tuple[int, Any]],
+        progress=None
+    ) -> Generator[Tuple[Dict[str, Any], int], None, None]:
         self.load_model(progress)
-        
-        if progress:
-            progress(0.3, desc="Loading audio file...")
-        
-        audio = whisper.load_audio(audio_path)
-        
+        language = None
+        previous_text = ""
+        for start, chunk in chunks:
+            # The tail of the previous chunk keeps the decoding context across chunk boundaries
+            with self._model_lock:
+                result = _transcribe_audio(
+                    self.model,
+                    chunk,
+                    language,
+                    start / SAMPLE_RATE,
+                    initial_prompt=previous_text[-Config.PROMPT_CONTEXT_CHARS:] or None
+                )
+            language = result["language"]
+            previous_text = result["text"]
+            yield result, start + len(chunk)
+
+    def transcribe(self, audio_path: str, progress=None) -> Generator[Dict[str, Any], None, None]:
+        audio_hash = file_hash(audio_path)
+        cache_key = ResultCache.make_key(audio_hash, self.backend_name, self.model_name)
+        cached = self.cache.get(cache_key) if self.cache else None
+        if cached is not None:
+            if progress:
+                progress(1.0, desc="Loaded transcription from cache")
+            yield dict(cached, new_segments=cached["segments"], progress=1.0, done=True, cached=True)
+            return
+
         if progress:
-            progress(0.5, desc="Starting transcription...")
-        
-        result = self.model.transcribe(
-            audio,
-            language=None,
-            task="transcribe",
-            word_timestamps=False,
-            fp16=False
-        )
-        
+            progress(0.0, desc="Loading audio file...")
+
+        # The audio is decoded as a stream, so memory use does not depend on
+        # the length of the recording; the duration is probed up front for
+        # progress reporting and to choose between the two modes.
+        expected_duration = probe_duration(audio_path)
+        windows = stream_audio(audio_path, SAMPLE_RATE, Config.DECODE_WINDOW_SECONDS)
+
+        if self.workers > 1 and (expected_duration or 0) >= self.parallel_min_seconds:
+            chunks = iter_chunks(windows, SAMPLE_RATE, Config.CHUNK_SECONDS, Config.CHUNK_SEARCH_SECONDS)
+            results = self._transcribe_parallel(chunks, progress)
+        else:
+            chunks = iter_chunks(windows, SAMPLE_RATE, Config.STREAM_CHUNK_SECONDS, Config.CHUNK_SEARCH_SECONDS)
+            results = self._transcribe_sequential(chunks, progress)
+
+        text = ""
+        language = "unknown"
+        segments: List[Dict[str, Any]] = []
+        end = 0
+        for chunk, end in results:
+            text += chunk["text"]
+            language = chunk["language"]
+            segments.extend(chunk["segments"])
+            decoded = end / SAMPLE_RATE
+            fraction = min(decoded / expected_duration, 0.99) if expected_duration else 0.0
+
+            if progress:
+                progress(fraction, desc=f"Transcribed {decoded:.0f} of {expected_duration or 0:.0f} seconds")
+
+            yield {
+                "text": text,
+                "language": language,
+                "duration": expected_duration or decoded,
+                "segments": segments,
+                "audio_hash": audio_hash,
+                "new_segments": chunk["segments"],
+                "progress": fraction,
+                "done": False,
+                "cached": False
+            }
+
+        result = {
+            "text": text,
+            "language": language,
+            "duration": end / SAMPLE_RATE,
+            "segments": segments,
+            "audio_hash": audio_hash
+        }
+        if self.cache:
+            self.cache.put(cache_key, result)
+
         if progress:
             progress(1.0, desc="Transcription complete")
-        
-        yield {
-            "text": result["text"],
-            "language": result.get("language", "unknown"),
-            "duration": len(audio) / whisper.audio.SAMPLE_RATE
-        }
-    
+
+        yield dict(result, new_segments=[], progress=1.0, done=True, cached=False)
+
     def transcribe_sync(self, audio_path: str, progress=None) -> Dict[str, Any]:
+        result = {}
         for result in self.transcribe(audio_path, progress):
-            return result
-        return {}
\ No newline at end of file
+            pass
+        return result
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
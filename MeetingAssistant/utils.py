@@ -1,6 +1,7 @@
 import os
+import re
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List
 from config import Config
 
 
@@ -36,6 +37,58 @@ def format_transcription_info(result: dict) -> str:
     return "\n".join(info_lines)
 
 
+def format_transcription_progress(result: dict) -> str:
+    text = result.get("text", "")
+    language = result.get("language", "unknown")
+    duration = result.get("duration", 0)
+    progress = result.get("progress", 0)
+    
+    info_lines = [
+        f"Transcribing... {progress * 100:.0f}%",
+        f"Language detected: {language}",
+        f"Transcribed {progress * duration:.1f} of {duration:.1f} seconds",
+        "-" * 50,
+        "\nTranscription:\n",
+        text
+    ]
+    
+    return "\n".join(info_lines)
+
+
+def format_timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for English text
+    return len(text) // 4 + 1
+
+
+def split_into_windows(text: str, max_tokens: int) -> List[str]:
+    windows = []
+    current = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text.strip()):
+        # A single overlong sentence is cut at word boundaries
+        while estimate_tokens(sentence) > max_tokens:
+            cut = sentence.rfind(" ", 0, max_tokens * 4)
+            cut = cut if cut > 0 else max_tokens * 4
+            if current:
+                windows.append(current)
+                current = ""
+            windows.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if current and estimate_tokens(current) + estimate_tokens(sentence) > max_tokens:
+            windows.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        windows.append(current)
+    return windows
+
+
 def save_to_file(content: str, filename: str, output_dir: str = "outputs") -> str:
     os.makedirs(output_dir, exist_ok=True)
     file_path = os.path.join(output_dir, filename)
@@ -0,0 +1,129 @@
+from typing import Any, Dict, List, Optional
+from config import Config
+
+
+SAMPLE_RATE = 16000
+N_SAMPLES = 30 * SAMPLE_RATE
+
+
+class OpenAIWhisperBackend:
+    # The reference openai-whisper implementation in fp32 PyTorch
+    name = "openai"
+
+    def __init__(self, model_name: str, device: str, threads: Optional[int] = None):
+        import torch
+        import whisper
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = whisper.load_model(model_name, device=device)
+
+    def detect_language(self, audio) -> str:
+        import whisper
+        audio = whisper.pad_or_trim(audio)
+        mel = whisper.log_mel_spectrogram(audio, n_mels=self.model.dims.n_mels).to(self.model.device)
+        _, probs = self.model.detect_language(mel)
+        return max(probs, key=probs.get)
+
+    def transcribe(self, audio, language: Optional[str] = None, initial_prompt: Optional[str] = None) -> Dict[str, Any]:
+        result = self.model.transcribe(
+            audio,
+            language=language,
+            task="transcribe",
+            word_timestamps=False,
+            fp16=False,
+            initial_prompt=initial_prompt
+        )
+        return {
+            "text": result["text"],
+            "language": result.get("language", language or "unknown"),
+            "segments": [
+                {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+                for segment in result.get("segments", [])
+            ]
+        }
+
+
+class QuantizedWhisperBackend(OpenAIWhisperBackend):
+    # openai-whisper with its Linear layers dynamically quantized to int8,
+    # which speeds up CPU inference and roughly halves the model's memory.
+    name = "openai-int8"
+
+    def __init__(self, model_name: str, device: str, threads: Optional[int] = None):
+        super().__init__(model_name, "cpu", threads)
+        import torch
+        import whisper
+        # whisper.model.Linear only adds dtype casting on top of nn.Linear;
+        # quantize_dynamic only converts exact nn.Linear modules.
+        for module in self.model.modules():
+            if isinstance(module, whisper.model.Linear):
+                module.__class__ = torch.nn.Linear
+        self.model = torch.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+
+class FasterWhisperBackend:
+    # CTranslate2 engine via faster-whisper (optional dependency), int8 on
+    # CPU by default. With WHISPER_BATCH_SIZE > 1 the 30 second windows of a
+    # chunk are decoded in batches.
+    name = "faster-whisper"
+
+    def __init__(self, model_name: str, device: str, threads: Optional[int] = None):
+        try:
+            from faster_whisper import BatchedInferencePipeline, WhisperModel
+        except ImportError as e:
+            raise ImportError(
+                "The faster-whisper backend requires the faster-whisper package: pip install faster-whisper"
+            ) from e
+        self.model = WhisperModel(
+            model_name,
+            device=device,
+            compute_type=Config.WHISPER_COMPUTE_TYPE,
+            cpu_threads=threads or 0
+        )
+        self.batched = None
+        if Config.WHISPER_BATCH_SIZE > 1:
+            self.batched = BatchedInferencePipeline(model=self.model)
+
+    def detect_language(self, audio) -> str:
+        # Language detection runs eagerly; the segments generator is never consumed
+        _, info = self.model.transcribe(audio[:N_SAMPLES])
+        return info.language
+
+    def transcribe(self, audio, language: Optional[str] = None, initial_prompt: Optional[str] = None) -> Dict[str, Any]:
+        if self.batched is not None:
+            segments, info = self.batched.transcribe(
+                audio,
+                language=language,
+                task="transcribe",
+                batch_size=Config.WHISPER_BATCH_SIZE,
+                initial_prompt=initial_prompt
+            )
+        else:
+            segments, info = self.model.transcribe(
+                audio,
+                language=language,
+                task="transcribe",
+                initial_prompt=initial_prompt
+            )
+        segments: List[Dict[str, Any]] = [
+            {"start": segment.start, "end": segment.end, "text": segment.text}
+            for segment in segments
+        ]
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "language": info.language,
+            "segments": segments
+        }
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (OpenAIWhisperBackend, QuantizedWhisperBackend, FasterWhisperBackend)
+}
+
+
+def load_backend(name: str, model_name: str, device: str, threads: Optional[int] = None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown Whisper backend '{name}'. Available: {', '.join(BACKENDS)}")
+    return BACKENDS[name](model_name, device, threads)
@@ -0,0 +1,116 @@
+"""Helpers for moving audio between the browser and the server as raw bytes.
+
+Synthesized speech is kept in a small in-memory store and served from its own
+URL instead of being base64-encoded into the JSON response, optionally
+compressed to Opus in an Ogg container. Uploaded recordings that the browser
+already converted to 16 kHz mono PCM WAV are decoded without going through
+ffmpeg.
+"""
+import io
+import subprocess
+import threading
+import uuid
+import wave
+from collections import OrderedDict
+
+import numpy as np
+
+# Whisper works on 16 kHz mono audio.
+STT_SAMPLE_RATE = 16000
+
+AUDIO_MIMETYPES = {
+    'wav': 'audio/wav',
+    'opus': 'audio/ogg; codecs=opus',
+}
+
+
+class AudioStore:
+    """Thread-safe, size-bounded store of synthesized audio clips.
+
+    The least recently used clips are dropped once the stored bytes exceed
+    max_bytes, so a long-running server does not keep every reply forever.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._clips = OrderedDict()  # audio_id -> (bytes, mimetype)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, audio_bytes, mimetype):
+        """Store a clip and return the id it can be fetched with."""
+        audio_id = uuid.uuid4().hex
+        with self._lock:
+            self._clips[audio_id] = (audio_bytes, mimetype)
+            self._size += len(audio_bytes)
+            while self._size > self.max_bytes and len(self._clips) > 1:
+                _, (evicted, _) = self._clips.popitem(last=False)
+                self._size -= len(evicted)
+        return audio_id
+
+    def get(self, audio_id):
+        """Return (bytes, mimetype) for a clip, or None if it is unknown or evicted."""
+        with self._lock:
+            clip = self._clips.get(audio_id)
+            if clip is not None:
+                self._clips.move_to_end(audio_id)
+            return clip
+
+
+def encode_ogg_opus(wav_bytes, bitrate='32k'):
+    """Compress WAV audio to Opus in an Ogg container using ffmpeg.
+
+    Args:
+        wav_bytes: Binary WAV audio data
+        bitrate: Target Opus bitrate
+
+    Returns:
+        bytes: Ogg/Opus encoded audio
+
+    Raises:
+        RuntimeError: If ffmpeg is missing or fails to encode the audio
+    """
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+             '-i', 'pipe:0', '-ar', '48000', '-c:a', 'libopus', '-b:a', bitrate,
+             '-f', 'ogg', 'pipe:1'],
+            input=wav_bytes, capture_output=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise RuntimeError(f"Opus encoding failed: {e}") from e
+    return result.stdout
+
+
+def encode_speech(wav_bytes, audio_format='wav'):
+    """Encode synthesized speech in the requested format.
+
+    Falls back to WAV when Opus encoding is not possible on this machine.
+
+    Returns:
+        tuple: (audio bytes, format name actually used)
+    """
+    if audio_format == 'opus':
+        try:
+            return encode_ogg_opus(wav_bytes), 'opus'
+        except RuntimeError as e:
+            print(e)
+    return wav_bytes, 'wav'
+
+
+def pcm_wav_to_float32(audio_binary):
+    """Decode a 16 kHz mono 16-bit PCM WAV into a float32 array for Whisper.
+
+    Returns:
+        numpy.ndarray or None: The samples scaled to [-1, 1], or None if the
+        data is not a WAV file in exactly that format.
+    """
+    try:
+        with wave.open(io.BytesIO(audio_binary)) as wav:
+            if (wav.getnchannels() != 1 or wav.getsampwidth() != 2
+                    or wav.getframerate() != STT_SAMPLE_RATE):
+                return None
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    return np.frombuffer(frames, dtype='<i2').astype(np.float32) / 32768.0
@@ -0,0 +1,114 @@
+"""Per-session, bounded conversation history for the chat model.
+
+Every voice client gets its own history, keyed by a session id, and each
+history is trimmed to a token budget so the prompt sent to the model (and
+with it the per-turn latency) stays bounded however long a session runs.
+Turns that fall out of the budget can be condensed into a running summary in
+the background, so the model keeps the gist of the early conversation.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def _message_tokens(message):
+    # Chat templates add a few tokens of framing per message
+    return estimate_tokens(message['content']) + 4
+
+
+class _Session:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turns = []        # user/assistant messages, oldest first
+        self.summary = ""      # condensed version of evicted turns
+        self.last_used = time.monotonic()
+
+
+class ChatHistoryStore:
+    """Keeps a bounded chat history per session.
+
+    Args:
+        token_budget: Maximum estimated tokens of turns kept per session
+        max_sessions: Sessions kept in memory; the least recently used go first
+        session_ttl: Seconds of inactivity after which a session is dropped
+        summarize: Optional function (previous summary, evicted messages) ->
+            new summary. When given, evicted turns are summarized in a
+            background thread instead of being forgotten.
+    """
+
+    def __init__(self, token_budget=2048, max_sessions=1000, session_ttl=3600, summarize=None):
+        self.token_budget = token_budget
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.summarize = summarize
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._summarizer = ThreadPoolExecutor(max_workers=1) if summarize else None
+
+    def _session(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.pop(session_id, None) or _Session()
+            session.last_used = now
+            self._sessions[session_id] = session
+            # Drop idle sessions and keep the number of sessions bounded
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if (len(self._sessions) <= self.max_sessions
+                        and now - oldest.last_used <= self.session_ttl):
+                    break
+                del self._sessions[oldest_id]
+            return session
+
+    def build_messages(self, session_id, user_message):
+        """Return the messages to send to the model for a new user message."""
+        session = self._session(session_id)
+        with session.lock:
+            messages = list(session.turns)
+            summary = session.summary
+        if summary:
+            messages.insert(0, {
+                'role': 'system',
+                'content': f"Summary of the earlier conversation: {summary}",
+            })
+        messages.append({'role': 'user', 'content': user_message})
+        return messages
+
+    def add_turn(self, session_id, user_message, response_text):
+        """Store a completed turn and trim the session to its token budget."""
+        session = self._session(session_id)
+        with session.lock:
+            session.turns.append({'role': 'user', 'content': user_message})
+            session.turns.append({'role': 'assistant', 'content': response_text})
+            evicted = []
+            total = sum(_message_tokens(m) for m in session.turns)
+            # Always keep the latest turn, even if it alone exceeds the budget
+            while total > self.token_budget and len(session.turns) > 2:
+                for message in session.turns[:2]:
+                    total -= _message_tokens(message)
+                evicted.extend(session.turns[:2])
+                del session.turns[:2]
+        if evicted and self._summarizer is not None:
+            self._summarizer.submit(self._fold_into_summary, session, evicted)
+
+    def _fold_into_summary(self, session, evicted):
+        with session.lock:
+            previous = session.summary
+        try:
+            summary = self.summarize(previous, evicted)
+        except Exception as e:
+            print(f"Chat history summarization failed: {e}")
+            return
+        with session.lock:
+            session.summary = summary
+
+    def clear(self, session_id):
+        """Forget a session's history."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
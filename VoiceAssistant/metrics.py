@@ -0,0 +1,104 @@
+"""Low-overhead latency metrics for the voice assistant.
+
+Stage timings (speech decoding, Whisper, the Ollama call, TTS, encoding) are
+recorded into fixed-bucket histograms that can be rendered in the Prometheus
+text format. Timings recorded while a request is being handled are also
+collected per request, so the server can return them in a Server-Timing
+header.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; voice turns range from milliseconds (encoding) to minutes (Bark).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Timings of the request currently handled by this thread, or None outside a request.
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Histogram:
+    """A fixed-bucket histogram with one series per label value."""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # label value -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        """Record one observation for the given label value."""
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += seconds
+
+    def render(self):
+        """Return the histogram in the Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for label_value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return "\n".join(lines)
+
+
+stage_seconds = Histogram(
+    'voice_assistant_stage_seconds', 'Time spent in each processing stage.', 'stage')
+request_seconds = Histogram(
+    'voice_assistant_request_seconds', 'Total time spent handling a request.', 'route')
+
+
+def record_stage(stage, seconds):
+    """Record a stage timing in the registry and for the current request."""
+    stage_seconds.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def timed(stage):
+    """Time the enclosed block as the given stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def begin_request():
+    """Start collecting stage timings for the request handled by this thread."""
+    return _request_timings.set([])
+
+
+def end_request(token):
+    """Stop collecting and return the (stage, seconds) timings of the request."""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings):
+    """Format (stage, seconds) pairs as a Server-Timing header value."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+def render_metrics():
+    """Return all histograms in the Prometheus text exposition format."""
+    return "\n".join([stage_seconds.render(), request_seconds.render()]) + "\n"
@@ -1,12 +1,52 @@
-import base64
 import json
-from flask import Flask, render_template, request
-from worker import speech_to_text, text_to_speech, ollama_process_message, preload_models
+import time
+import uuid
+from flask import Flask, render_template, request, abort, g
+from worker import speech_to_text, text_to_speech, ollama_process_message, preload_models, stop_tts_workers
+from audio_transport import AudioStore, AUDIO_MIMETYPES, encode_speech
+import metrics
 from flask_cors import CORS
 import os
 
 app = Flask(__name__)
-cors = CORS(app, resources={r"/*": {"origins": "*"}})
+cors = CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['Server-Timing', 'X-Request-ID'])
+
+# Synthesized replies are served from /audio/<id> instead of inlined as base64
+audio_store = AudioStore()
+
+
+@app.before_request
+def start_request_timing():
+    """Assign a request id and start collecting the request's stage timings.
+
+    A client can send the same X-Request-ID to /speech-to-text and
+    /process-message to tie both halves of a voice turn together.
+    """
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.request_start = time.perf_counter()
+    g.timings_token = metrics.begin_request()
+
+
+@app.after_request
+def add_timing_headers(response):
+    """Return the request's stage timings in a Server-Timing header."""
+    if 'timings_token' not in g:
+        return response
+    timings = metrics.end_request(g.pop('timings_token'))
+    total = time.perf_counter() - g.request_start
+    if request.url_rule is not None and request.endpoint != 'metrics_route':
+        metrics.request_seconds.observe(request.url_rule.rule, total)
+    response.headers['Server-Timing'] = metrics.server_timing_header(timings + [('total', total)])
+    response.headers['X-Request-ID'] = g.request_id
+    print(f"[{g.request_id}] {request.path} {response.status_code} {total * 1000:.0f}ms")
+    return response
+
+
+@app.teardown_request
+def discard_request_timing(exc):
+    """Stop collecting timings for requests that failed before after_request ran."""
+    if 'timings_token' in g:
+        metrics.end_request(g.pop('timings_token'))
 
 
 @app.route('/', methods=['GET'])
@@ -20,10 +60,11 @@ def speech_to_text_route():
     """Process speech-to-text conversion endpoint.
 
     Accepts binary audio data in request body and returns transcribed text.
+    The browser sends 16 kHz mono PCM WAV; other formats are decoded with ffmpeg.
     """
     print("processing speech-to-text")
-    audio_binary = request.data # Get the user's speech from their request
-    text = speech_to_text(audio_binary) # Call speech_to_text function to transcribe the speech
+    audio_binary = request.get_data() # Get the user's speech from their request
+    text = speech_to_text(audio_binary, request.content_type) # Call speech_to_text function to transcribe the speech
 
     # Return the response back to the user in JSON format
     response = app.response_class(
@@ -40,12 +81,15 @@ def speech_to_text_route():
 def process_message_route():
     """Process user message through LLM and convert response to speech.
 
-    Accepts JSON with 'userMessage' and 'voice' fields.
-    Returns JSON with 'ollamaResponseText' and 'ollamaResponseSpeech' (base64 encoded audio).
+    Accepts JSON with 'userMessage', 'voice' and optional 'audioFormat' and 'sessionId' fields.
+    Returns JSON with 'ollamaResponseText' and 'ollamaResponseSpeechUrl', the
+    URL the binary audio of the reply can be fetched from.
 
     Args in request.json:
         userMessage: Text message from user
         voice: TTS voice engine to use ('basic', 'coqui', or 'bark')
+        audioFormat: 'wav' (default) or 'opus' for Ogg/Opus compressed speech
+        sessionId: Conversation the message belongs to; each session keeps its own history
     """
     user_message = request.json['userMessage'] # Get user's message from their request
     print('user_message', user_message)
@@ -53,8 +97,10 @@ def process_message_route():
     voice = request.json['voice'] # Get user's preferred voice from their request
     print('voice', voice)
 
+    session_id = request.json.get('sessionId', 'default') # Keep each client's conversation apart
+
     # Call ollama_process_message function to process the user's message and get a response back
-    ollama_response_text = ollama_process_message(user_message)
+    ollama_response_text = ollama_process_message(user_message, session_id)
 
     # Clean the response to remove any emptylines
     ollama_response_text = os.linesep.join([s for s in ollama_response_text.splitlines() if s])
@@ -62,14 +108,18 @@ def process_message_route():
     # Call our text_to_speech function to convert OpenAI Api's reponse to speech
     ollama_response_speech = text_to_speech(ollama_response_text, voice)
 
-    # convert ollama_response_speech to base64 string so it can be sent back in the JSON response
+    # Keep the speech as bytes and hand out a URL for it rather than inlining it in the JSON response
+    ollama_response_speech_url = None
     if ollama_response_speech:
-        ollama_response_speech = base64.b64encode(ollama_response_speech).decode('utf-8')
-
+        audio_format = request.json.get('audioFormat', 'wav')
+        with metrics.timed('encode'):
+            speech, audio_format = encode_speech(ollama_response_speech, audio_format)
+        audio_id = audio_store.put(speech, AUDIO_MIMETYPES[audio_format])
+        ollama_response_speech_url = f"/audio/{audio_id}"
 
-    # Send a JSON response back to the user containing their message's response both in text and speech formats
+    # Send a JSON response back to the user containing their message's response in text and a link to the speech
     response = app.response_class(
-        response=json.dumps({"ollamaResponseText": ollama_response_text, "ollamaResponseSpeech": ollama_response_speech}),
+        response=json.dumps({"ollamaResponseText": ollama_response_text, "ollamaResponseSpeechUrl": ollama_response_speech_url}),
         status=200,
         mimetype='application/json'
     )
@@ -78,6 +128,29 @@ def process_message_route():
     return response
 
 
+@app.route('/audio/<audio_id>', methods=['GET'])
+def audio_route(audio_id):
+    """Serve the binary audio of a synthesized reply."""
+    clip = audio_store.get(audio_id)
+    if clip is None:
+        abort(404)
+    audio_bytes, mimetype = clip
+    return app.response_class(response=audio_bytes, status=200, mimetype=mimetype)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_route():
+    """Expose the stage and request latency histograms in Prometheus text format."""
+    return app.response_class(
+        response=metrics.render_metrics(),
+        status=200,
+        mimetype='text/plain; version=0.0.4'
+    )
+
+
 if __name__ == "__main__":
     preload_models()
-    app.run(port=8000, host='0.0.0.0')
+    try:
+        app.run(port=8000, host='0.0.0.0', threaded=True)
+    finally:
+        stop_tts_workers()
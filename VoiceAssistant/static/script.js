@@ -6,6 +6,16 @@ const responses = [];
 const botRepeatButtonIDToIndexMap = {};
 const userRepeatButtonIDToRecordingMap = {};
 const baseUrl = window.location.origin;
+// Conversation id, kept for the lifetime of the browser tab
+const sessionID =
+  sessionStorage.getItem("sessionID") ||
+  Date.now().toString(36) + Math.random().toString(36).substr(2);
+sessionStorage.setItem("sessionID", sessionID);
+const STT_SAMPLE_RATE = 16000;
+// Ask for compressed Ogg/Opus speech when the browser can play it
+const responseAudioFormat = new Audio().canPlayType('audio/ogg; codecs="opus"')
+  ? "opus"
+  : "wav";
 
 async function showBotLoadingAnimation() {
   await sleep(500);
@@ -25,28 +35,110 @@ function hideUserLoadingAnimation() {
   $(".loading-animation")[0].style.display = "none";
 }
 
-const getSpeechToText = async (userRecording) => {
+const getSpeechToText = async (userRecording, requestID) => {
   let response = await fetch(baseUrl + "/speech-to-text", {
     method: "POST",
-    body: userRecording.audioBlob,
+    headers: {
+      "Content-Type": userRecording.uploadBlob.type,
+      "X-Request-ID": requestID,
+    },
+    body: userRecording.uploadBlob,
   });
-  console.log(response);
+  console.log(response.headers.get("Server-Timing"));
   response = await response.json();
   console.log(response);
   return response.text;
 };
 
-const processUserMessage = async (userMessage) => {
+const processUserMessage = async (userMessage, requestID) => {
   let response = await fetch(baseUrl + "/process-message", {
     method: "POST",
-    headers: { Accept: "application/json", "Content-Type": "application/json" },
-    body: JSON.stringify({ userMessage: userMessage, voice: voiceOption }),
+    headers: {
+      Accept: "application/json",
+      "Content-Type": "application/json",
+      "X-Request-ID": requestID,
+    },
+    body: JSON.stringify({
+      userMessage: userMessage,
+      voice: voiceOption,
+      audioFormat: responseAudioFormat,
+      sessionId: sessionID,
+    }),
   });
+  console.log(response.headers.get("Server-Timing"));
   response = await response.json();
   console.log(response);
   return response;
 };
 
+const fetchResponseAudio = async (speechUrl) => {
+  // Fetch the reply's audio as binary and keep it as an object URL for replay
+  if (!speechUrl) {
+    return null;
+  }
+  const response = await fetch(baseUrl + speechUrl);
+  if (!response.ok) {
+    return null;
+  }
+  return URL.createObjectURL(await response.blob());
+};
+
+const encodeWav = (samples, sampleRate) => {
+  // 16-bit PCM mono WAV
+  const buffer = new ArrayBuffer(44 + samples.length * 2);
+  const view = new DataView(buffer);
+  const writeString = (offset, text) => {
+    for (let i = 0; i < text.length; i++) {
+      view.setUint8(offset + i, text.charCodeAt(i));
+    }
+  };
+  writeString(0, "RIFF");
+  view.setUint32(4, 36 + samples.length * 2, true);
+  writeString(8, "WAVE");
+  writeString(12, "fmt ");
+  view.setUint32(16, 16, true);
+  view.setUint16(20, 1, true); // PCM
+  view.setUint16(22, 1, true); // mono
+  view.setUint32(24, sampleRate, true);
+  view.setUint32(28, sampleRate * 2, true);
+  view.setUint16(32, 2, true);
+  view.setUint16(34, 16, true);
+  writeString(36, "data");
+  view.setUint32(40, samples.length * 2, true);
+  for (let i = 0; i < samples.length; i++) {
+    const s = Math.max(-1, Math.min(1, samples[i]));
+    view.setInt16(44 + i * 2, s < 0 ? s * 0x8000 : s * 0x7fff, true);
+  }
+  return new Blob([buffer], { type: "audio/wav" });
+};
+
+const toSpeechUpload = async (audioBlob) => {
+  // Downmix and resample the recording to 16 kHz mono, the format Whisper uses,
+  // so the upload is small and the server can skip decoding it with ffmpeg.
+  // Falls back to the recorder's own format if the browser cannot do this.
+  try {
+    const decodeContext = new AudioContext();
+    const decoded = await decodeContext.decodeAudioData(
+      await audioBlob.arrayBuffer()
+    );
+    decodeContext.close();
+    const offline = new OfflineAudioContext(
+      1,
+      Math.ceil(decoded.duration * STT_SAMPLE_RATE),
+      STT_SAMPLE_RATE
+    );
+    const source = offline.createBufferSource();
+    source.buffer = decoded;
+    source.connect(offline.destination);
+    source.start();
+    const rendered = await offline.startRendering();
+    return encodeWav(rendered.getChannelData(0), STT_SAMPLE_RATE);
+  } catch (error) {
+    console.log(error);
+    return audioBlob;
+  }
+};
+
 const cleanTextInput = (value) => {
   return value
     .trim() // remove starting and ending spaces
@@ -69,12 +161,16 @@ const recordAudio = () => {
 
     const stop = () =>
       new Promise((resolve) => {
-        mediaRecorder.addEventListener("stop", () => {
-          const audioBlob = new Blob(audioChunks, { type: "audio/mpeg" });
+        mediaRecorder.addEventListener("stop", async () => {
+          const audioBlob = new Blob(audioChunks, {
+            type: mediaRecorder.mimeType,
+          });
           const audioUrl = URL.createObjectURL(audioBlob);
           const audio = new Audio(audioUrl);
           const play = () => audio.play();
-          resolve({ audioBlob, audioUrl, play });
+          stream.getTracks().forEach((track) => track.stop());
+          const uploadBlob = await toSpeechUpload(audioBlob);
+          resolve({ audioBlob, uploadBlob, audioUrl, play });
         });
 
         mediaRecorder.stop();
@@ -149,9 +245,10 @@ const populateUserMessage = (userMessage, userRecording) => {
   scrollToBottom();
 };
 
-const populateBotResponse = async (userMessage) => {
+const populateBotResponse = async (userMessage, requestID = getRandomID()) => {
   await showBotLoadingAnimation();
-  const response = await processUserMessage(userMessage);
+  const response = await processUserMessage(userMessage, requestID);
+  response.audioUrl = await fetchResponseAudio(response.ollamaResponseSpeechUrl);
   responses.push(response);
 
   const repeatButtonID = getRandomID();
@@ -163,10 +260,12 @@ const populateBotResponse = async (userMessage) => {
       !lightMode ? " dark" : ""
     }'>${
       response.ollamaResponseText
-    }</div><button id='${repeatButtonID}' class='btn volume repeat-button' onclick='playResponseAudio("data:audio/wav;base64," + responses[botRepeatButtonIDToIndexMap[this.id]].ollamaResponseSpeech);console.log(this.id)'><i class='fa fa-volume-up'></i></button></div>`
+    }</div><button id='${repeatButtonID}' class='btn volume repeat-button' onclick='playResponseAudio(responses[botRepeatButtonIDToIndexMap[this.id]].audioUrl);console.log(this.id)'><i class='fa fa-volume-up'></i></button></div>`
   );
 
-  playResponseAudio("data:audio/wav;base64," + response.ollamaResponseSpeech);
+  if (response.audioUrl) {
+    playResponseAudio(response.audioUrl);
+  }
 
   scrollToBottom();
 };
@@ -209,9 +308,11 @@ $(document).ready(function () {
       toggleRecording().then(async (userRecording) => {
         console.log("stop recording");
         await showUserLoadingAnimation();
-        const userMessage = await getSpeechToText(userRecording);
+        // Use one request id for both halves of the voice turn
+        const requestID = getRandomID();
+        const userMessage = await getSpeechToText(userRecording, requestID);
         populateUserMessage(userMessage, userRecording);
-        populateBotResponse(userMessage);
+        populateBotResponse(userMessage, requestID);
       });
       $(".fa-microphone").css("color", "#125ee5");
       recording = false;
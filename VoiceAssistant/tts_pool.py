@@ -0,0 +1,411 @@
+"""Long-lived worker processes for the text-to-speech engines.
+
+Every TTS engine (basic/pyttsx3, Coqui and Bark) gets its own pool of worker
+processes. A worker loads its engine once when it starts and then serves
+synthesis jobs sent to it by the pool, so a request no longer pays the
+engine start-up cost and concurrent requests are spread over the workers
+instead of waiting behind each other on the Flask request thread.
+
+The heavy TTS libraries are only imported inside the worker processes.
+"""
+import collections
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+
+
+class TTSTimeoutError(TimeoutError):
+    """Raised when a synthesis job runs longer than the pool's job timeout."""
+
+
+class TTSWorkerError(RuntimeError):
+    """Raised when a worker fails a job or dies while running it."""
+
+
+def _render_to_wav(render):
+    """Run render(path) against a private temp file and return the WAV bytes.
+
+    Every job gets its own file so concurrent workers never overwrite each
+    other's output (they used to share a single "response.wav").
+    """
+    fd, path = tempfile.mkstemp(suffix=".wav")
+    os.close(fd)
+    try:
+        render(path)
+        with open(path, 'rb') as audio_binary:
+            return audio_binary.read()
+    finally:
+        os.remove(path)
+
+
+def _load_basic():
+    """Initialise a pyttsx3 engine with the assistant's voice settings."""
+    import pyttsx3
+    basic_tts_engine = pyttsx3.init()             # Initiate the engine
+    basic_tts_engine.setProperty('rate', 100)     # setting up new voice rate
+    basic_tts_engine.setProperty('pitch', -200)     # lowering the pitch
+    # default voice = en -- very robotic on linux while using espeak
+    try:
+        basic_tts_engine.setProperty('voice', 'mb-us2') # install mbrola-us2 to use mb-us2 for slightly better voice
+    except:
+        basic_tts_engine.setProperty('voice', 'en') # default British english voice
+    return basic_tts_engine
+
+
+def _synthesize_basic(basic_tts_engine, text):
+    """Synthesize text with pyttsx3, waiting for its finished-utterance event."""
+    finished = []
+
+    def render(path):
+        token = basic_tts_engine.connect(
+            'finished-utterance', lambda name, completed: finished.append(completed))
+        try:
+            basic_tts_engine.save_to_file(text, path)
+            basic_tts_engine.runAndWait()
+        finally:
+            basic_tts_engine.disconnect(token)
+        # The espeak driver writes the file before it fires finished-utterance,
+        # so once the event has been seen the WAV is complete.
+        if not finished or not finished[-1]:
+            raise TTSWorkerError("pyttsx3 did not finish the utterance")
+
+    return _render_to_wav(render)
+
+
+def _load_coqui():
+    """Load the Coqui VITS model on the CPU."""
+    from TTS.api import TTS
+    return TTS(model_name="tts_models/eng/fairseq/vits").to("cpu")
+
+
+def _synthesize_coqui(api, text):
+    """Synthesize text with an already loaded Coqui model."""
+    return _render_to_wav(lambda path: api.tts_to_file(text, file_path=path))
+
+
+BARK_VOICE_PRESET = "v2/en_speaker_6"
+
+
+def _load_bark():
+    """Load the Bark processor and model and the voice preset embedding.
+
+    The preset is loaded once here and reused for every job, instead of being
+    read from disk again on each processor call.
+
+    Requires HF_TOKEN environment variable for model download from HuggingFace.
+    """
+    import numpy as np
+    from transformers import AutoProcessor, BarkModel
+    token = os.getenv('HF_TOKEN')
+    bark_processor = AutoProcessor.from_pretrained("suno/bark-small", token=token)
+    bark_model = BarkModel.from_pretrained("suno/bark-small", token=token)
+    history_prompt = bark_processor(
+        "", voice_preset=BARK_VOICE_PRESET, return_tensors="np")["history_prompt"]
+    voice_preset = {key: np.asarray(value) for key, value in history_prompt.items()}
+    return bark_processor, bark_model, voice_preset
+
+
+def _synthesize_bark(engine, text):
+    """Synthesize one text segment with an already loaded Bark model.
+
+    Returns:
+        tuple: (sample rate, float32 numpy array); the caller joins segments
+        and writes the WAV.
+    """
+    bark_processor, bark_model, voice_preset = engine
+
+    inputs = bark_processor(text, voice_preset=voice_preset)
+    audio_array = bark_model.generate(**inputs)
+    audio_array = audio_array.cpu().numpy().squeeze()
+
+    sample_rate = bark_model.generation_config.sample_rate
+    return sample_rate, audio_array
+
+
+# engine name -> (load(), synthesize(engine, text) -> WAV bytes, or (rate, samples) for Bark)
+ENGINES = {
+    'basic': (_load_basic, _synthesize_basic),
+    'coqui': (_load_coqui, _synthesize_coqui),
+    'bark': (_load_bark, _synthesize_bark),
+}
+
+
+def _worker_main(engine_name, jobs, results, threads):
+    """Entry point of a worker process: load the engine once, then serve jobs.
+
+    jobs and results are this worker's own pipe ends, so a worker that is
+    killed mid-message can only corrupt its own pipe.
+    """
+    if threads:
+        # Split the cores between the workers instead of oversubscribing them
+        import torch
+        torch.set_num_threads(threads)
+    load, synthesize = ENGINES[engine_name]
+    engine = load()
+    print(f"{engine_name} TTS worker {os.getpid()} ready")
+    results.send(('ready', None, None))
+    while True:
+        job = jobs.recv()
+        if job is None:
+            break
+        job_id, text = job
+        try:
+            results.send(('done', job_id, synthesize(engine, text)))
+        except Exception as e:
+            results.send(('error', job_id, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    """A worker process, its pipe ends and the job it is running."""
+
+    def __init__(self, process, jobs, results):
+        self.process = process
+        self.jobs = jobs
+        self.results = results
+        self.ready = False
+        self.job_id = None
+        self.started = None    # monotonic time the current job was sent
+
+    def close(self):
+        self.jobs.close()
+        self.results.close()
+
+
+class TTSWorkerPool:
+    """A pool of worker processes that all hold the same TTS engine.
+
+    Jobs wait in the pool until a worker is idle and are then sent to it over
+    that worker's pipe. A job that runs longer than `timeout` seconds fails
+    with a TTSTimeoutError and its worker is killed and replaced; time spent
+    waiting for a worker does not count against it. With `queue_timeout` set,
+    a job that waited that long without being started fails as well, so a
+    request is never queued indefinitely. Workers that die are replaced;
+    when the last worker dies before its engine has loaded, the waiting jobs
+    fail instead of waiting for the next attempt.
+    `threads` limits the torch threads of each worker.
+    """
+
+    # Seconds before a worker that died while loading its engine is restarted
+    RESTART_DELAY = 5
+
+    def __init__(self, engine_name, workers=1, timeout=120, threads=None, queue_timeout=None):
+        if engine_name not in ENGINES:
+            raise ValueError(f"Unknown TTS engine: {engine_name}")
+        self.engine_name = engine_name
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.threads = threads
+        self._ctx = multiprocessing.get_context("spawn")
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._futures = {}     # job_id -> (Future, monotonic time it may wait until, or None)
+        self._pending = collections.deque()  # (job_id, text) not yet sent to a worker
+        self._workers = {}     # results connection -> _Worker
+        self._restarts = []    # monotonic times at which to start a replacement worker
+        self._closed = False
+        for _ in range(workers):
+            self._spawn_worker()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    def _spawn_worker(self):
+        jobs_reader, jobs_writer = self._ctx.Pipe(duplex=False)
+        results_reader, results_writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(self.engine_name, jobs_reader, results_writer, self.threads),
+            daemon=True,
+        )
+        process.start()
+        # The child holds its own copies; closing ours lets recv() see EOF when it dies
+        jobs_reader.close()
+        results_writer.close()
+        self._workers[results_reader] = _Worker(process, jobs_writer, results_reader)
+
+    def submit(self, text, queue_timeout=None):
+        """Queue text for synthesis and return a Future resolving to the engine's output.
+
+        queue_timeout overrides the pool's limit on waiting for a worker, e.g.
+        for a job that is queued behind other parts of the same request.
+        """
+        future = Future()
+        if queue_timeout is None:
+            queue_timeout = self.queue_timeout
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{self.engine_name} TTS pool is closed")
+            job_id = next(self._job_ids)
+            wait_until = None if queue_timeout is None else time.monotonic() + queue_timeout
+            self._futures[job_id] = (future, wait_until)
+            self._pending.append((job_id, text))
+            self._dispatch()
+        return future
+
+    def cancel(self, futures):
+        """Cancel the jobs of futures that are still waiting for a worker.
+
+        Jobs a worker has already started run to completion; their results
+        are discarded by the caller.
+        """
+        with self._lock:
+            cancelled = {
+                job_id for job_id, (future, _) in self._futures.items()
+                if future in futures and future.cancel()
+            }
+            for job_id in cancelled:
+                del self._futures[job_id]
+            self._pending = collections.deque(
+                (job_id, text) for job_id, text in self._pending if job_id not in cancelled)
+
+    def synthesize(self, text):
+        """Synthesize text in a worker and block until the result is ready."""
+        return self.submit(text).result()
+
+    def _fail(self, job_id, error):
+        future, _ = self._futures.pop(job_id, (None, None))
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def _dispatch(self):
+        """Send waiting jobs to idle workers."""
+        for worker in self._workers.values():
+            if not self._pending:
+                return
+            if not worker.ready or worker.job_id is not None:
+                continue
+            job_id, text = self._pending.popleft()
+            future = self._futures[job_id][0]
+            if future.cancelled():
+                del self._futures[job_id]
+                continue
+            try:
+                worker.jobs.send((job_id, text))
+            except OSError:
+                # The worker died; the next collector pass replaces it
+                self._pending.appendleft((job_id, text))
+                continue
+            # A running job can no longer be cancelled
+            future.set_running_or_notify_cancel()
+            worker.job_id = job_id
+            worker.started = time.monotonic()
+
+    def _collect(self):
+        """Resolve futures from worker results, replace dead workers and enforce the job timeout."""
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                readers = list(self._workers)
+            try:
+                ready = multiprocessing.connection.wait(readers, timeout=0.5)
+            except (OSError, ValueError):
+                # A connection was closed by close() while waiting
+                continue
+            for reader in ready:
+                try:
+                    kind, job_id, payload = reader.recv()
+                except (EOFError, OSError):
+                    # The worker died or was killed; _check_workers handles it
+                    continue
+                with self._lock:
+                    worker = self._workers.get(reader)
+                    if worker is None:
+                        continue
+                    if kind == 'ready':
+                        worker.ready = True
+                        continue
+                    worker.job_id = None
+                    future, _ = self._futures.pop(job_id, (None, None))
+                    if future is not None and kind == 'done':
+                        future.set_result(payload)
+                    elif future is not None:
+                        future.set_exception(TTSWorkerError(payload))
+            with self._lock:
+                if self._closed:
+                    return
+                self._check_workers()
+                self._expire_pending()
+                self._dispatch()
+
+    def _check_workers(self):
+        """Replace workers that died or ran a job longer than the timeout."""
+        now = time.monotonic()
+        for reader, worker in list(self._workers.items()):
+            process = worker.process
+            job_id = worker.job_id
+            if job_id is not None and now - worker.started > self.timeout:
+                error = TTSTimeoutError(
+                    f"{self.engine_name} TTS job exceeded {self.timeout}s")
+                process.kill()
+            elif not process.is_alive():
+                error = TTSWorkerError(
+                    f"{self.engine_name} TTS worker {process.pid} died during a job")
+            else:
+                continue
+            process.join()
+            worker.close()
+            del self._workers[reader]
+            if job_id is not None:
+                self._fail(job_id, error)
+
+            if worker.ready:
+                self._spawn_worker()
+                continue
+            # Loading the engine failed (e.g. a model download); retry later
+            # and fail the waiting jobs unless another worker may still run them
+            self._restarts.append(now + self.RESTART_DELAY)
+            if not self._workers:
+                while self._pending:
+                    pending_id, _ = self._pending.popleft()
+                    self._fail(pending_id, TTSWorkerError(
+                        f"{self.engine_name} TTS worker {process.pid} exited with code "
+                        f"{process.exitcode} before loading its engine"))
+
+        for restart in list(self._restarts):
+            if now >= restart:
+                self._restarts.remove(restart)
+                self._spawn_worker()
+
+    def _expire_pending(self):
+        """Fail jobs that waited longer than their queue timeout for a worker."""
+        now = time.monotonic()
+        waiting = collections.deque()
+        for job_id, text in self._pending:
+            wait_until = self._futures[job_id][1]
+            if wait_until is not None and now > wait_until:
+                self._fail(job_id, TTSTimeoutError(
+                    f"{self.engine_name} TTS job waited too long for a worker"))
+            else:
+                waiting.append((job_id, text))
+        self._pending = waiting
+
+    def close(self):
+        """Stop all workers once they have finished their current job and fail the waiting jobs."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers.values())
+            self._workers.clear()
+            self._pending.clear()
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for worker in workers:
+            try:
+                worker.jobs.send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
+            worker.close()
+        for future, _ in futures:
+            if not future.done():
+                future.set_exception(TTSWorkerError(f"{self.engine_name} TTS pool was closed"))
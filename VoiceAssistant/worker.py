@@ -1,43 +1,171 @@
-import requests
 import os, time
+import io
+import mimetypes
+import re
+import wave
+import tempfile
+import threading
+from concurrent.futures import FIRST_EXCEPTION, wait
 from ollama import chat, generate
-from ollama import ChatResponse
-from dotenv import load_dotenv, dotenv_values 
-import pyttsx3
+from dotenv import load_dotenv
+import numpy as np
 import whisper
-from transformers import AutoProcessor, BarkModel
-import scipy
-from TTS.api import TTS
+from tts_pool import TTSWorkerPool
+from audio_transport import pcm_wav_to_float32
+from metrics import timed, record_stage
+from chat_history import ChatHistoryStore
 
 # loading variables from .env file
 # Stor your HF_TOKEN from HuggingFace for faster downloads of models.
 load_dotenv()
 
+# Number of long-lived worker processes per TTS engine, the maximum number of
+# seconds a single synthesis job may run before its worker is replaced, and
+# how long a job may wait for a free worker before it fails.
+TTS_WORKERS = {
+    'basic': int(os.getenv('TTS_BASIC_WORKERS', 2)),
+    'coqui': int(os.getenv('TTS_COQUI_WORKERS', 1)),
+    'bark': int(os.getenv('TTS_BARK_WORKERS', max(1, min(4, (os.cpu_count() or 1) // 4)))),
+}
+TTS_JOB_TIMEOUT = float(os.getenv('TTS_JOB_TIMEOUT', 300))
+TTS_QUEUE_TIMEOUT = float(os.getenv('TTS_QUEUE_TIMEOUT', 600))
+
+# Bark replies are split into segments of at most this many characters
+# (Bark produces about 13 seconds of audio per generation) which the Bark
+# workers synthesize in parallel.
+BARK_SEGMENT_CHARS = int(os.getenv('BARK_SEGMENT_CHARS', 220))
+BARK_SEGMENT_PAUSE = 0.15  # seconds of silence between joined segments
+
+LLM_MODEL = 'llama3.2:1b'
+# Per-session chat history: estimated token budget, number of sessions kept,
+# idle seconds before a session is dropped, and whether evicted turns are
+# summarized in the background.
+CHAT_HISTORY_TOKENS = int(os.getenv('CHAT_HISTORY_TOKENS', 2048))
+CHAT_MAX_SESSIONS = int(os.getenv('CHAT_MAX_SESSIONS', 1000))
+CHAT_SESSION_TTL = float(os.getenv('CHAT_SESSION_TTL', 3600))
+CHAT_HISTORY_SUMMARIZE = os.getenv('CHAT_HISTORY_SUMMARIZE', '1') == '1'
+
+tts_pools = {}
+_tts_pools_lock = threading.Lock()
+
 
 def preload_models():
-    """Preload Whisper and Coqui TTS models into memory for faster inference."""
+    """Preload Whisper and start the TTS worker processes for faster inference."""
     whisper.load_model("base")
-    TTS(model_name="tts_models/eng/fairseq/vits").to("cpu")
+    start_tts_workers()
 
 
-def speech_to_text(audio_binary):
+def speech_to_text(audio_binary, content_type=None):
     """Convert audio binary data to text using OpenAI Whisper model.
 
     Args:
         audio_binary: Binary audio data (e.g., WAV format)
+        content_type: MIME type of the upload, used to pick the file suffix
+            when the audio has to be decoded by ffmpeg
 
     Returns:
         str: Transcribed text from the audio
     """
     print("Whisper STT")
     # setting the model
-    sttmodel = whisper.load_model("base")
-    with open("audio.wav", 'wb') as audiofile:
+    with timed('stt_model_load'):
+        sttmodel = whisper.load_model("base")
+    # The browser normally uploads 16 kHz mono PCM, which Whisper takes as is.
+    with timed('decode'):
+        audio = pcm_wav_to_float32(audio_binary)
+    if audio is not None:
+        with timed('stt_transcribe'):
+            return sttmodel.transcribe(audio)["text"]
+
+    suffix = mimetypes.guess_extension((content_type or '').split(';')[0].strip()) or '.audio'
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as audiofile:
         audiofile.write(audio_binary)
-    result = sttmodel.transcribe('audio.wav')
+    try:
+        # Whisper decodes the file with ffmpeg as part of transcribe
+        with timed('stt_transcribe'):
+            result = sttmodel.transcribe(audiofile.name)
+    finally:
+        os.remove(audiofile.name)
     return result["text"] 
 
 
+def split_text_segments(text, max_chars):
+    """Split text into sentence-aligned segments of at most max_chars characters.
+
+    Sentences are packed together while they fit; a sentence that is longer
+    than max_chars on its own is split at word boundaries.
+
+    Args:
+        text: Text to split
+        max_chars: Maximum length of a segment
+
+    Returns:
+        list: The text segments, in order
+    """
+    segments = []
+    current = ""
+    for sentence in re.split(r'(?<=[.!?;:])\s+|\n+', text.strip()):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                segments.append(current)
+                current = ""
+            segments.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}".strip()
+    if current:
+        segments.append(current)
+    return segments or [text]
+
+
+def float32_to_wav(audio_array, sample_rate):
+    """Encode float32 samples in [-1, 1] as 16-bit PCM mono WAV bytes."""
+    pcm = (np.clip(audio_array, -1.0, 1.0) * 32767).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def _get_tts_pool(voice):
+    """Return the worker pool for a TTS engine, starting it on first use."""
+    with _tts_pools_lock:
+        if voice not in tts_pools:
+            # Give each torch-based worker an equal share of the cores
+            threads = None
+            if voice != 'basic':
+                threads = max(1, (os.cpu_count() or 1) // TTS_WORKERS[voice])
+            tts_pools[voice] = TTSWorkerPool(
+                voice, workers=TTS_WORKERS[voice], timeout=TTS_JOB_TIMEOUT, threads=threads,
+                queue_timeout=TTS_QUEUE_TIMEOUT)
+        return tts_pools[voice]
+
+
+def start_tts_workers():
+    """Start the worker processes of every TTS engine so they load their models up front."""
+    for voice in TTS_WORKERS:
+        _get_tts_pool(voice)
+
+
+def stop_tts_workers():
+    """Shut down all TTS worker processes."""
+    with _tts_pools_lock:
+        for pool in tts_pools.values():
+            pool.close()
+        tts_pools.clear()
+
+
 def basic_text_to_speech(response_text):
     """Convert text to speech using pyttsx3 (basic offline TTS engine).
 
@@ -48,22 +176,7 @@ def basic_text_to_speech(response_text):
         bytes: Binary WAV audio data of the synthesized speech
     """
     print("Basic TTS")
-    basic_tts_engine = pyttsx3.init()             # Initiate the engine
-    basic_tts_engine.setProperty('rate', 100)     # setting up new voice rate
-    basic_tts_engine.setProperty('pitch', -200)     # lowering the pitch
-    # default voice = en -- very robotic on linux while using espeak
-    try:
-        basic_tts_engine.setProperty('voice', 'mb-us2') # install mbrola-us2 to use mb-us2 for slightly better voice
-    except:
-        basic_tts_engine.setProperty('voice', 'en') # default British english voice
-    basic_tts_engine.save_to_file(response_text, "response.wav") 
-    basic_tts_engine.runAndWait()
-    time.sleep(3)
-    # read in the response.wav file as audio_binary
-    with open("response.wav", 'rb') as audio_binary:
-        speech_response = audio_binary.read()
-    os.remove("response.wav")
-    return speech_response
+    return _get_tts_pool('basic').synthesize(response_text)
 
 
 def bark_text_to_speech(text):
@@ -79,23 +192,32 @@ def bark_text_to_speech(text):
         Requires HF_TOKEN environment variable for model download from HuggingFace
     """
     print("Bark TTS")
-    token = os.getenv('HF_TOKEN')
-    bark_processor = AutoProcessor.from_pretrained("suno/bark-small", token=token)
-    bark_model = BarkModel.from_pretrained("suno/bark-small", token=token)
-    print("Done loading models")
+    pool = _get_tts_pool('bark')
+    segments = split_text_segments(text, BARK_SEGMENT_CHARS)
+    # Submit every segment at once so all Bark workers generate in parallel.
+    # Later segments wait behind earlier ones of the same reply, so their
+    # queue budget grows by one job timeout per round of workers.
+    workers = TTS_WORKERS['bark']
+    futures = [
+        pool.submit(segment, queue_timeout=TTS_QUEUE_TIMEOUT + TTS_JOB_TIMEOUT * (index // workers))
+        for index, segment in enumerate(segments)
+    ]
+    done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+    failed = [future for future in futures if future in done and future.exception()]
+    if failed:
+        # The reply is lost anyway; free the workers from its queued segments
+        pool.cancel(futures)
+        raise failed[0].exception()
+    results = [future.result() for future in futures]
 
-    voice_preset = "v2/en_speaker_6"
-    inputs = bark_processor(text, voice_preset=voice_preset)
-    audio_array = bark_model.generate(**inputs)
-    audio_array = audio_array.cpu().numpy().squeeze()
-
-    sample_rate = bark_model.generation_config.sample_rate
-    scipy.io.wavfile.write("response.wav", rate=sample_rate, data=audio_array)
-
-    with open("response.wav", 'rb') as audio_binary:
-        speech_response = audio_binary.read()
-    os.remove("response.wav")
-    return speech_response
+    sample_rate = results[0][0]
+    if any(rate != sample_rate for rate, _ in results):
+        raise RuntimeError("Bark segments came back with different sample rates")
+    pause = np.zeros(int(sample_rate * BARK_SEGMENT_PAUSE), dtype=np.float32)
+    pieces = []
+    for _, audio_array in results:
+        pieces.extend([np.asarray(audio_array, dtype=np.float32).reshape(-1), pause])
+    return float32_to_wav(np.concatenate(pieces[:-1]), sample_rate)
 
 
 def coqui_text_to_speech(text):
@@ -107,13 +229,8 @@ def coqui_text_to_speech(text):
     Returns:
         bytes: Binary WAV audio data of the synthesized speech
     """
-    api = TTS(model_name="tts_models/eng/fairseq/vits").to("cpu")
-    api.tts_to_file(text, file_path="response.wav")
-    with open("response.wav", 'rb') as audio_binary:
-        speech_response = audio_binary.read()
-    os.remove("response.wav")
-    return speech_response    
-    
+    return _get_tts_pool('coqui').synthesize(text)
+
 
 def text_to_speech(text, voice='basic'):
     """Convert text to speech using specified TTS engine.
@@ -126,36 +243,68 @@ def text_to_speech(text, voice='basic'):
         bytes: Binary WAV audio data of the synthesized speech
     """
     if voice=='basic' or voice=='default':
-        return basic_text_to_speech(text)
+        with timed('tts_basic'):
+            return basic_text_to_speech(text)
     elif voice=='coqui':
-        return coqui_text_to_speech(text)
+        with timed('tts_coqui'):
+            return coqui_text_to_speech(text)
     elif voice=='bark':
-        return bark_text_to_speech(text)
+        with timed('tts_bark'):
+            return bark_text_to_speech(text)
+
+
+def summarize_history(previous_summary, evicted_messages):
+    """Fold chat turns that no longer fit the history budget into a short summary.
+
+    Args:
+        previous_summary: Summary of even older turns (may be empty)
+        evicted_messages: The user/assistant messages dropped from the history
+
+    Returns:
+        str: The updated summary
+    """
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in evicted_messages)
+    prompt = (
+        "Update the summary of a conversation between a user and an assistant. "
+        "Keep facts, names and open questions; stay under 150 words.\n\n"
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New turns:\n{transcript}\n\nUpdated summary:"
+    )
+    response = generate(model=LLM_MODEL, prompt=prompt, options={'num_predict': 256})
+    return response.response.strip()
+
+
+chat_history = ChatHistoryStore(
+    token_budget=CHAT_HISTORY_TOKENS,
+    max_sessions=CHAT_MAX_SESSIONS,
+    session_ttl=CHAT_SESSION_TTL,
+    summarize=summarize_history if CHAT_HISTORY_SUMMARIZE else None,
+)
 
 
-messages = []
-def ollama_process_message(user_message):
+def ollama_process_message(user_message, session_id='default'):
     """Process user message using Ollama Llama 3.2 1B model with conversation history.
 
     Args:
         user_message: User's text message to process
+        session_id: Identifies the conversation the message belongs to
 
     Returns:
         str: The chatbot's text response
 
     Note:
-        Maintains conversation history in the global 'messages' list
+        History is kept per session and trimmed to CHAT_HISTORY_TOKENS
+        (see chat_history.py), so prompts do not grow without limit.
     """
-    message =  {
-        'role': 'user', 
-        'content': user_message,
-    }
-    messages.append(message)
-    response: ChatResponse = chat(model='llama3.2:1b', messages=messages)
-    response_text = response.message.content
-    response_message = {
-        'role': 'chatbot', 
-        'content': response_text,
-    }
-    messages.append(response_message)
-    return response_text
\ No newline at end of file
+    messages = chat_history.build_messages(session_id, user_message)
+    # Stream the reply so the time to the first token can be measured
+    start = time.perf_counter()
+    chunks = []
+    for chunk in chat(model=LLM_MODEL, messages=messages, stream=True):
+        if not chunks:
+            record_stage('llm_first_token', time.perf_counter() - start)
+        chunks.append(chunk.message.content)
+    record_stage('llm_total', time.perf_counter() - start)
+    response_text = ''.join(chunks)
+    chat_history.add_turn(session_id, user_message, response_text)
+    return response_text